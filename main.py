@@ -12,7 +12,7 @@ from datetime import datetime
 sys.path.insert(0, str(Path(__file__).parent / "src"))
 
 from loguru import logger
-from src.punch_clock import PunchClockService
+from src.punch_clock import PunchClockService, BrowserManager
 from src.config import config_manager
 from src.models import PunchAction, PunchResult
 from src.scheduler import scheduler_manager
@@ -64,19 +64,22 @@ async def run_visual_test(args):
         elif args.sign_out:
             punch_action = PunchAction.SIGN_OUT
         
-        # 顯示測試參數
-        logger.info("🔧 測試配置:")
-        logger.info(f"   測試模式: {test_type}")
-        logger.info(f"   無頭模式: {'否' if args.show_browser else '是'}")
-        logger.info(f"   互動模式: {'是' if args.interactive else '否'}")
-        logger.info(f"   截圖目錄: {args.screenshots_dir}")
+        # 顯示測試參數（組合成單一日誌記錄輸出）
+        config_lines = [
+            "🔧 測試配置:",
+            f"   測試模式: {test_type}",
+            f"   無頭模式: {'否' if args.show_browser else '是'}",
+            f"   互動模式: {'是' if args.interactive else '否'}",
+            f"   截圖目錄: {args.screenshots_dir}"
+        ]
         if punch_action:
-            action_name = "簽到" if punch_action == PunchAction.SIGN_IN else "簽退"
-            logger.info(f"   指定動作: {action_name}")
+            action_name = punch_action.display_name
+            config_lines.append(f"   指定動作: {action_name}")
         if args.output_json:
-            logger.info(f"   JSON輸出: {args.output_json}")
+            config_lines.append(f"   JSON輸出: {args.output_json}")
         if args.output_html:
-            logger.info(f"   HTML報告: {args.output_html}")
+            config_lines.append(f"   HTML報告: {args.output_html}")
+        logger.info("\n".join(config_lines))
         
         if args.real_punch:
             logger.warning("⚠️ 警告：真實打卡模式已啟用！")
@@ -97,7 +100,7 @@ async def run_visual_test(args):
         
         # 保存結果
         if args.output_json:
-            success = service.save_json_report(test_result, Path(args.output_json))
+            success = await service.save_json_report(test_result, Path(args.output_json))
             if success:
                 logger.info(f"📄 JSON報告已生成: {args.output_json}")
             else:
@@ -105,7 +108,7 @@ async def run_visual_test(args):
         
         # 生成HTML報告
         if args.output_html:
-            success = service.generate_html_report(test_result, Path(args.output_html))
+            success = await service.generate_html_report(test_result, Path(args.output_html), args.standalone_html)
             if success:
                 logger.info(f"📄 HTML報告已生成: {args.output_html}")
             else:
@@ -209,7 +212,8 @@ async def punch_callback(action: PunchAction) -> PunchResult:
             gps_config=config.gps,
             webhook_config=config.webhook,
             interactive_mode=False,
-            scheduler_mode=True  # 啟用排程器模式，直接執行真實打卡
+            scheduler_mode=True,  # 啟用排程器模式，直接執行真實打卡
+            reuse_browser=True  # 排程期間重用瀏覽器行程
         )
         
         # 執行真實打卡操作
@@ -264,6 +268,7 @@ async def run_scheduler():
         logger.error(f"排程器運行錯誤: {e}")
     finally:
         await scheduler_manager.shutdown()
+        await BrowserManager.shutdown_shared_browser()
         logger.info("📴 排程器已停止")
 
 
@@ -271,6 +276,7 @@ async def test_webhook_functionality():
     """測試 webhook 通知功能"""
     logger.info("🧪 開始測試 webhook 通知功能...")
     
+    service = None
     try:
         # 載入配置
         config = config_manager.load_config()
@@ -349,6 +355,10 @@ async def test_webhook_functionality():
         logger.error(f"Webhook 測試過程發生錯誤: {e}")
         print(f"💥 測試失敗: {e}")
         print("📋 請檢查配置檔案和錯誤日誌")
+    finally:
+        # 測試與額外通知共用同一組 webhook 連線，結束後關閉
+        if service and service.webhook_manager:
+            await service.webhook_manager.close()
 
 
 def main():
@@ -445,6 +455,12 @@ def main():
         help='生成HTML視覺化測試報告'
     )
     
+    parser.add_argument(
+        '--standalone-html',
+        action='store_true',
+        help='HTML報告內嵌截圖（單一檔案，體積較大）'
+    )
+    
     parser.add_argument(
         '--log-level',
         choices=['DEBUG', 'INFO', 'WARNING', 'ERROR'],
@@ -520,10 +536,10 @@ def main():
     
     # 檢查視覺化參數是否在非視覺化模式下使用
     visual_only_params = [
-        args.show_browser, args.interactive, args.output_json, args.output_html
+        args.show_browser, args.interactive, args.output_json, args.output_html, args.standalone_html
     ]
     if any(visual_only_params):
-        print("❌ 視覺化參數 (--show-browser, --interactive, --output-json, --output-html) 只能在 --visual 模式下使用")
+        print("❌ 視覺化參數 (--show-browser, --interactive, --output-json, --output-html, --standalone-html) 只能在 --visual 模式下使用")
         return
     
     # 確定要執行的打卡動作
@@ -541,12 +557,12 @@ def main():
         print("⚠️ 真實打卡模式已啟用")
         print("💡 系統將詢問您確認後才會實際點擊打卡按鈕")
         if punch_action:
-            action_name = "簽到" if punch_action == "sign_in" else "簽退"
+            action_name = PunchAction(punch_action).display_name
             print(f"🎯 將執行: {action_name}")
     else:
         print("🔄 模擬測試模式（不會實際打卡）")
         if punch_action:
-            action_name = "簽到" if punch_action == "sign_in" else "簽退"
+            action_name = PunchAction(punch_action).display_name
             print(f"🎯 將測試: {action_name}")
     
     print()
@@ -3,12 +3,14 @@
 """
 
 import os
-from pathlib import Path
-from typing import Optional
-from dotenv import load_dotenv
+from typing import Optional, Set
+from dotenv import dotenv_values
 
 from src.models import LoginCredentials, ScheduleConfig, AppConfig, GPSConfig, WebhookConfig
 
+# 行程啟動時已存在的環境變數（例如 docker-compose 的 environment），優先於 .env
+_PROCESS_ENV_KEYS = frozenset(os.environ)
+
 
 class ConfigManager:
     """配置管理器 - 使用環境變數進行配置"""
@@ -16,15 +18,43 @@ class ConfigManager:
     def __init__(self, env_file: str = ".env"):
         self.env_file = env_file
         self._config: Optional[AppConfig] = None
+        self._env_mtime: Optional[float] = self._get_env_mtime()
+        # 由 .env 寫入 os.environ 的鍵，重新載入時用來更新或移除
+        self._dotenv_keys: Set[str] = set()
         
         # 載入環境變數
-        if Path(env_file).exists():
-            load_dotenv(env_file)
+        self._apply_env_file()
+    
+    def _get_env_mtime(self) -> Optional[float]:
+        """取得 .env 檔案的修改時間，檔案不存在時返回 None"""
+        try:
+            return os.stat(self.env_file).st_mtime
+        except OSError:
+            return None
+    
+    def _apply_env_file(self) -> None:
+        """將 .env 的值套用到 os.environ（行程本身的環境變數優先，不被 .env 覆寫）"""
+        values = dotenv_values(self.env_file) if self._env_mtime is not None else {}
+        
+        # .env 中已刪除的鍵一併移除
+        for key in self._dotenv_keys - values.keys():
+            os.environ.pop(key, None)
+        
+        applied = set()
+        for key, value in values.items():
+            if value is None or key in _PROCESS_ENV_KEYS:
+                continue
+            os.environ[key] = value
+            applied.add(key)
+        self._dotenv_keys = applied
     
     def load_config(self) -> AppConfig:
-        """從環境變數載入配置"""
+        """從環境變數載入配置（.env 未變更時直接返回快取）"""
         if self._config is not None:
-            return self._config
+            if self._get_env_mtime() == self._env_mtime:
+                return self._config
+            # .env 已變更，重新讀取後再解析
+            self.invalidate()
         
         # 登入憑證 - 必要參數
         login_config = LoginCredentials(
@@ -76,6 +106,12 @@ class ConfigManager:
         
         return self._config
     
+    def invalidate(self) -> None:
+        """清除快取的配置並重新讀取 .env，下次 load_config 時重新解析"""
+        self._config = None
+        self._env_mtime = self._get_env_mtime()
+        self._apply_env_file()
+    
     def get_login_credentials(self) -> LoginCredentials:
         """取得登入憑證"""
         config = self.load_config()
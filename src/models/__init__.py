@@ -32,8 +32,6 @@ from .webhook import (
     WebhookConfig,
     WebhookMessage,
     WebhookResponse,
-    DiscordEmbed,
-    DiscordWebhookPayload,
 )
 
 # 定義可公開導出的所有模型
@@ -57,6 +55,4 @@ __all__ = [
     "WebhookConfig",
     "WebhookMessage",
     "WebhookResponse",
-    "DiscordEmbed",
-    "DiscordWebhookPayload",
 ]
\ No newline at end of file
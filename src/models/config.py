@@ -2,7 +2,9 @@
 配置相關資料模型
 """
 
-from pydantic import BaseModel
+from functools import cached_property
+from typing import Tuple
+from pydantic import BaseModel, field_validator
 from .core import LoginCredentials
 from .webhook import WebhookConfig
 
@@ -14,6 +16,14 @@ class GPSConfig(BaseModel):
     address: str = "台北市"  # 地址描述
 
 
+def _parse_hm(value: str) -> Tuple[int, int]:
+    """將 "HH:MM" 解析為 (時, 分)"""
+    hour, minute = map(int, value.split(':'))
+    if not (0 <= hour < 24 and 0 <= minute < 60):
+        raise ValueError(f"時間超出範圍: {value}")
+    return hour, minute
+
+
 class ScheduleConfig(BaseModel):
     """排程設定"""
     clock_in_time: str = "09:00"
@@ -21,6 +31,26 @@ class ScheduleConfig(BaseModel):
     enabled: bool = True
     weekdays_only: bool = True
     status_message_interval: int = 300  # 定期確認訊息間隔時間（秒），預設5分鐘
+    
+    @field_validator('clock_in_time', 'clock_out_time')
+    @classmethod
+    def _validate_time(cls, value: str) -> str:
+        """載入配置時即檢查時間格式"""
+        try:
+            _parse_hm(value)
+        except ValueError as e:
+            raise ValueError(f"時間格式應為 HH:MM: {value}") from e
+        return value
+    
+    @cached_property
+    def clock_in_hm(self) -> Tuple[int, int]:
+        """簽到時間 (時, 分)"""
+        return _parse_hm(self.clock_in_time)
+    
+    @cached_property
+    def clock_out_hm(self) -> Tuple[int, int]:
+        """簽退時間 (時, 分)"""
+        return _parse_hm(self.clock_out_time)
 
 
 class AppConfig(BaseModel):
@@ -14,6 +14,18 @@ class PunchAction(str, Enum):
     SIGN_IN = "sign_in"      # 簽到
     SIGN_OUT = "sign_out"    # 簽退
     SIMULATE = "simulate"    # 模擬模式
+    
+    @property
+    def display_name(self) -> str:
+        """動作的中文名稱"""
+        return _ACTION_DISPLAY_NAMES[self]
+
+
+_ACTION_DISPLAY_NAMES = {
+    PunchAction.SIGN_IN: "簽到",
+    PunchAction.SIGN_OUT: "簽退",
+    PunchAction.SIMULATE: "模擬",
+}
 
 
 class LoginCredentials(BaseModel):
@@ -2,10 +2,11 @@
 測試相關資料模型
 """
 
+import time
 from datetime import datetime
 from pathlib import Path
 from typing import List, Optional
-from pydantic import BaseModel
+from pydantic import BaseModel, PrivateAttr
 
 
 class ScreenshotInfo(BaseModel):
@@ -36,9 +37,39 @@ class VisualTestResult(BaseModel):
     screenshots: List[ScreenshotInfo] = []
     error_screenshots: List[ScreenshotInfo] = []
     
+    # 單調時鐘起訖點（奈秒），持續時間不受系統時間調整影響
+    _start_ns: int = PrivateAttr(default_factory=time.monotonic_ns)
+    _end_ns: Optional[int] = PrivateAttr(default=None)
+    # 步驟成功數與總數，隨 add_step 累加
+    _successes: int = PrivateAttr(default=0)
+    _total: int = PrivateAttr(default=0)
+    
+    def model_post_init(self, __context) -> None:
+        self._total = len(self.steps)
+        self._successes = sum(1 for step in self.steps if step.success)
+    
+    def add_step(self, step: TestStep) -> None:
+        """添加測試步驟並更新成功計數"""
+        self.steps.append(step)
+        self._total += 1
+        if step.success:
+            self._successes += 1
+    
+    @property
+    def all_steps_succeeded(self) -> bool:
+        """是否所有步驟皆成功"""
+        return self._successes == self._total
+    
+    def mark_finished(self, end_time: datetime) -> None:
+        """記錄測試結束時間"""
+        self.end_time = end_time
+        self._end_ns = time.monotonic_ns()
+    
     @property
     def duration(self) -> Optional[float]:
         """計算測試持續時間（秒）"""
+        if self._end_ns is not None:
+            return (self._end_ns - self._start_ns) / 1e9
         if self.end_time:
             return (self.end_time - self.start_time).total_seconds()
         return None
@@ -46,7 +77,6 @@ class VisualTestResult(BaseModel):
     @property
     def success_rate(self) -> float:
         """計算成功率"""
-        if not self.steps:
+        if not self._total:
             return 0.0
-        successful_steps = sum(1 for step in self.steps if step.success)
-        return successful_steps / len(self.steps)
\ No newline at end of file
+        return self._successes / self._total
\ No newline at end of file
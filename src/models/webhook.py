@@ -78,32 +78,4 @@ class WebhookResponse(BaseModel):
     status_code: Optional[int] = None
     response_text: Optional[str] = None
     error_message: Optional[str] = None
-    timestamp: datetime = Field(default_factory=datetime.now)
-
-
-class DiscordEmbed(BaseModel):
-    """Discord Embed 格式"""
-    title: str
-    description: str
-    color: int
-    timestamp: str
-    
-    # 欄位
-    fields: Optional[List[Dict[str, Any]]] = None
-    
-    # 頁尾
-    footer: Optional[Dict[str, str]] = None
-    
-    # 縮圖
-    thumbnail: Optional[Dict[str, str]] = None
-
-
-class DiscordWebhookPayload(BaseModel):
-    """Discord Webhook 請求格式"""
-    content: Optional[str] = None
-    embeds: Optional[List[DiscordEmbed]] = None
-    username: Optional[str] = "震旦HR打卡機器人"
-    avatar_url: Optional[str] = None
-    
-    # 檔案上傳時使用
-    files: Optional[List[str]] = None
\ No newline at end of file
+    timestamp: datetime = Field(default_factory=datetime.now)
\ No newline at end of file
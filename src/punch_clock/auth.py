@@ -4,15 +4,56 @@
 """
 
 from playwright.async_api import Page
+from playwright.async_api import TimeoutError as PlaywrightTimeoutError
 from loguru import logger
 
 from src.models import LoginCredentials
 from src.retry_handler import retry_on_error, LoginError, NetworkError, BrowserError
+from .browser import BASE_URL
+
+
+# 登入後頁面（或登入錯誤訊息）出現的標記，任一出現即可開始驗證登入結果
+POST_LOGIN_SELECTOR = '.toolbar-title, ion-col:has(p:text("出勤打卡")), .error-message, .alert-danger'
+
+# 登出按鈕或連結，只取可見的元素
+LOGOUT_SELECTOR = (
+    'button:has-text("登出"):visible, a:has-text("登出"):visible, '
+    'button:has-text("Logout"):visible, a:has-text("Logout"):visible, '
+    '.logout-btn:visible, #logout:visible'
+)
+
+# 一次寫入所有登入欄位並觸發 input 事件，回傳找不到的欄位名稱
+FILL_LOGIN_FORM_SCRIPT = """
+(fields) => {
+    const missing = [];
+    for (const [name, value] of Object.entries(fields)) {
+        const el = document.querySelector(`input[name="${name}"]`);
+        if (!el) {
+            missing.push(name);
+            continue;
+        }
+        el.value = value;
+        el.dispatchEvent(new Event('input', { bubbles: true }));
+        el.dispatchEvent(new Event('change', { bubbles: true }));
+    }
+    return missing;
+}
+"""
 
 
 class AuthHandler:
     """登入處理器"""
     
+    _BASE_URL = BASE_URL
+    
+    # 登入錯誤訊息選擇器
+    _ERROR_SELECTORS = (
+        'text="帳號或密碼錯誤"',
+        'text="登入失敗"',
+        '.error-message',
+        '.alert-danger',
+    )
+    
     def __init__(self, page: Page):
         self.page = page
     
@@ -26,9 +67,7 @@ class AuthHandler:
             await self.page.wait_for_selector('input[name="CompId"]', timeout=10000)
             
             # 填入憑證
-            await self.page.fill('input[name="CompId"]', credentials.company_id)
-            await self.page.fill('input[name="UserId"]', credentials.user_id)
-            await self.page.fill('input[name="Passwd"]', credentials.password)
+            await self._fill_credentials(credentials)
             
             logger.info("已填入登入資訊")
             
@@ -36,8 +75,8 @@ class AuthHandler:
             await self.page.click('button:has-text("登入")')
             logger.info("已點擊登入按鈕")
             
-            # 等待頁面跳轉
-            await self.page.wait_for_load_state('networkidle', timeout=15000)
+            # 等待登入後頁面標記出現，不等待整個網路靜止
+            await self._wait_for_post_login()
             
             # 驗證登入結果
             if await self._verify_login_success():
@@ -52,38 +91,51 @@ class AuthHandler:
             # LoginError 已經在上面處理了，直接重新拋出
             raise
         except Exception as e:
-            logger.error(f"登入過程中發生錯誤: {e}")
+            logger.error("登入過程中發生錯誤: {}", e)
             # 根據錯誤類型決定是否要重試
-            if "timeout" in str(e).lower() or "network" in str(e).lower():
+            error_text = str(e).lower()
+            if "timeout" in error_text or "network" in error_text:
                 raise NetworkError(f"網路錯誤: {e}")
             else:
                 raise BrowserError(f"瀏覽器錯誤: {e}")
     
+    async def _fill_credentials(self, credentials: LoginCredentials) -> None:
+        """以單次 evaluate 填入登入欄位，失敗時退回逐欄 fill"""
+        fields = {
+            "CompId": credentials.company_id,
+            "UserId": credentials.user_id,
+            "Passwd": credentials.password,
+        }
+        
+        missing = await self.page.evaluate(FILL_LOGIN_FORM_SCRIPT, fields)
+        for name in missing:
+            await self.page.fill(f'input[name="{name}"]', fields[name])
+    
+    async def _wait_for_post_login(self, timeout: int = 15000) -> None:
+        """等待登入後的頁面標記，找不到時退回等待 DOM 載入"""
+        try:
+            await self.page.locator(POST_LOGIN_SELECTOR).first.wait_for(state='visible', timeout=timeout)
+        except PlaywrightTimeoutError:
+            logger.warning("未偵測到登入後頁面標記，改為等待 DOM 載入完成")
+            await self.page.wait_for_load_state('domcontentloaded', timeout=timeout)
+    
     async def _verify_login_success(self) -> bool:
         """驗證登入是否成功"""
         try:
             current_url = self.page.url
-            base_url = "https://erpline.aoacloud.com.tw"
             
             # 檢查URL是否已跳轉且不在登入頁面
-            if current_url != base_url and "login" not in current_url.lower():
-                logger.info(f"登入成功，當前URL: {current_url}")
+            if not self._is_login_url(current_url):
+                logger.info("登入成功，當前URL: {}", current_url)
                 return True
             
             # 額外檢查：是否有登入錯誤訊息
-            error_selectors = [
-                'text="帳號或密碼錯誤"',
-                'text="登入失敗"',
-                '.error-message',
-                '.alert-danger'
-            ]
-            
-            for selector in error_selectors:
+            for selector in self._ERROR_SELECTORS:
                 try:
                     error_element = await self.page.query_selector(selector)
                     if error_element and await error_element.is_visible():
                         error_text = await error_element.text_content()
-                        logger.error(f"檢測到登入錯誤: {error_text}")
+                        logger.error("檢測到登入錯誤: {}", error_text)
                         return False
                 except Exception:
                     continue
@@ -93,19 +145,21 @@ class AuthHandler:
             return False
             
         except Exception as e:
-            logger.error(f"驗證登入狀態時發生錯誤: {e}")
+            logger.error("驗證登入狀態時發生錯誤: {}", e)
             return False
     
+    @classmethod
+    def _is_login_url(cls, url: str) -> bool:
+        """判斷網址是否為登入頁面"""
+        return url == cls._BASE_URL or "login" in url.lower()
+    
     async def get_login_status(self) -> dict:
         """獲取當前登入狀態資訊"""
         try:
             current_url = self.page.url
             
             # 檢查是否在登入頁面
-            is_login_page = (
-                current_url == "https://erpline.aoacloud.com.tw" or 
-                "login" in current_url.lower()
-            )
+            is_login_page = self._is_login_url(current_url)
             
             # 嘗試獲取使用者資訊（如果已登入）
             user_info = None
@@ -130,7 +184,7 @@ class AuthHandler:
             }
             
         except Exception as e:
-            logger.error(f"獲取登入狀態失敗: {e}")
+            logger.error("獲取登入狀態失敗: {}", e)
             return {
                 "is_logged_in": False,
                 "current_url": self.page.url if self.page else "",
@@ -142,38 +196,28 @@ class AuthHandler:
     async def logout(self) -> bool:
         """執行登出操作（如果支援）"""
         try:
-            # 尋找登出按鈕或連結
-            logout_selectors = [
-                'button:has-text("登出")',
-                'a:has-text("登出")',
-                'button:has-text("Logout")',
-                'a:has-text("Logout")',
-                '.logout-btn',
-                '#logout'
-            ]
-            
-            for selector in logout_selectors:
-                try:
-                    logout_element = await self.page.query_selector(selector)
-                    if logout_element and await logout_element.is_visible():
-                        await logout_element.click()
-                        logger.info("已點擊登出按鈕")
-                        
-                        # 等待跳轉到登入頁面
-                        await self.page.wait_for_load_state('networkidle', timeout=10000)
-                        
-                        # 驗證是否回到登入頁面
-                        current_url = self.page.url
-                        if current_url == "https://erpline.aoacloud.com.tw" or "login" in current_url.lower():
-                            logger.info("登出成功")
-                            return True
-                        break
-                except Exception:
-                    continue
+            # 任一登出按鈕或連結可見即點擊
+            logout_element = self.page.locator(LOGOUT_SELECTOR).first
+            try:
+                await logout_element.wait_for(state='visible', timeout=3000)
+            except PlaywrightTimeoutError:
+                logger.warning("未找到登出按鈕或登出失敗")
+                return False
+            
+            await logout_element.click()
+            logger.info("已點擊登出按鈕")
+            
+            # 等待跳轉到登入頁面
+            await self.page.wait_for_load_state('networkidle', timeout=10000)
+            
+            # 驗證是否回到登入頁面
+            if self._is_login_url(self.page.url):
+                logger.info("登出成功")
+                return True
             
             logger.warning("未找到登出按鈕或登出失敗")
             return False
             
         except Exception as e:
-            logger.error(f"登出過程發生錯誤: {e}")
+            logger.error("登出過程發生錯誤: {}", e)
             return False
\ No newline at end of file
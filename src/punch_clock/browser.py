@@ -3,83 +3,284 @@
 負責瀏覽器的初始化、配置和清理
 """
 
+import asyncio
+import re
 from typing import Optional, Literal
-from playwright.async_api import async_playwright, Browser, Page, Playwright
+from playwright.async_api import async_playwright, Browser, BrowserContext, Page, Playwright, Route
 from loguru import logger
 
 from src.models import GPSConfig
 from src.retry_handler import BrowserError
 
 
+# 震旦HR系統網址
+BASE_URL = "https://erpline.aoacloud.com.tw"
+
+# Chromium 啟動參數
+CHROMIUM_LAUNCH_ARGS = [
+    '--no-sandbox',
+    '--disable-dev-shm-usage',
+    '--disable-gpu',
+    '--disable-web-security',
+    '--use-fake-ui-for-media-stream',
+    '--use-fake-device-for-media-stream',
+    '--disable-extensions',
+    '--disable-background-networking',
+    # 避免背景或被遮蔽的分頁遭降速，headless 下計時器與渲染維持全速
+    '--disable-background-timer-throttling',
+    '--disable-renderer-backgrounding',
+    '--disable-backgrounding-occluded-windows',
+    '--disable-features=TranslateUI',
+]
+
+USER_AGENT = (
+    'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 '
+    '(KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36'
+)
+
+# 分析與追蹤服務的網址關鍵字
+BLOCKED_URL_KEYWORDS = (
+    'google-analytics.com',
+    'googletagmanager.com',
+    'doubleclick.net',
+)
+
+# 自動化流程不需要下載的媒體檔案副檔名
+BLOCKED_MEDIA_EXTENSIONS = ('mp4', 'webm', 'ogg', 'mp3', 'wav', 'm4a')
+
+# 不需要截圖時才攔截的圖片與字型副檔名（截圖需要圖示字型才能正確顯示）
+BLOCKED_VISUAL_EXTENSIONS = (
+    'png', 'jpg', 'jpeg', 'gif', 'webp', 'svg', 'ico', 'bmp',
+    'woff', 'woff2', 'ttf', 'otf', 'eot',
+)
+
+
+def _blocked_url_pattern(extensions: tuple[str, ...]) -> re.Pattern[str]:
+    """建立要攔截的網址規則：追蹤服務網域，或以指定副檔名結尾的資源"""
+    hosts = '|'.join(re.escape(keyword) for keyword in BLOCKED_URL_KEYWORDS)
+    suffixes = '|'.join(extensions)
+    return re.compile(rf'(?:{hosts})|\.(?:{suffixes})(?:[?#]|$)', re.IGNORECASE)
+
+
+# 頁面檢查輔助函式（物件運算式），以 init script 注入每個頁面為 window.__pc，每份文件只解析一次
+PAGE_HELPERS = """({
+    // 頁面標題、是否為打卡頁面與GPS地圖狀態
+    pageInfo() {
+        const title = (document.querySelector('.toolbar-title')?.textContent || '').trim();
+        const hasSignIn = [...document.querySelectorAll('button')].some(b => b.textContent.includes('簽到'));
+        return {
+            title,
+            isPunchPage: title.includes('打卡') || hasSignIn,
+            gpsLoaded: !!document.querySelector('#divImap iframe')
+        };
+    }
+})"""
+PAGE_HELPERS_SCRIPT = f"window.__pc = {PAGE_HELPERS};"
+
+# 讀取頁面資訊；頁面不是由 BrowserManager.new_context 建立（未注入 window.__pc）時改用內嵌定義
+PAGE_INFO_EXPRESSION = f"(window.__pc || {PAGE_HELPERS}).pageInfo()"
+
+
 class BrowserManager:
-    """瀏覽器生命周期管理器"""
+    """瀏覽器生命周期管理器
+
+    啟用 reuse_browser 時，Playwright 與 Chromium 行程會在同一個事件迴圈內共用，
+    每次 initialize 只建立新的 context/page，避免重複啟動瀏覽器。
+    acquire_context/release_context 以引用計數追蹤借用中的 context，
+    瀏覽器本身必須由擁有事件迴圈的一方呼叫 shutdown_shared_browser 關閉
+    （排程器在 run_scheduler 的 finally 中呼叫）。不使用 atexit：
+    asyncio.run 結束時事件迴圈已關閉，atexit 階段無法再執行非同步清理。
+    """
+    
+    # 共用的瀏覽器行程（僅在 reuse_browser=True 時使用）
+    _shared_playwright: Optional[Playwright] = None
+    _shared_browser: Optional[Browser] = None
+    _shared_headless: Optional[bool] = None
+    _shared_loop: Optional[asyncio.AbstractEventLoop] = None
+    # 目前借用共用瀏覽器的 context 數量
+    _shared_refcount: int = 0
+    # 避免多個工作同時啟動共用瀏覽器（綁定到建立它的事件迴圈）
+    _shared_lock: Optional[asyncio.Lock] = None
+    _shared_lock_loop: Optional[asyncio.AbstractEventLoop] = None
     
-    def __init__(self, headless: bool = True, gps_config: Optional[GPSConfig] = None):
+    def __init__(self, headless: bool = True, gps_config: Optional[GPSConfig] = None,
+                 reuse_browser: bool = False, block_visual_assets: bool = False):
         self.headless = headless
         self.gps_config = gps_config or GPSConfig()
+        self.reuse_browser = reuse_browser
+        # 不需要截圖時連同圖片與字型一起攔截，減少頁面載入量
+        self._blocked_url_pattern = _blocked_url_pattern(
+            BLOCKED_MEDIA_EXTENSIONS + BLOCKED_VISUAL_EXTENSIONS if block_visual_assets
+            else BLOCKED_MEDIA_EXTENSIONS
+        )
         self.playwright: Optional[Playwright] = None
         self.browser: Optional[Browser] = None
+        self.context: Optional[BrowserContext] = None
         self.page: Optional[Page] = None
-        self._base_url = "https://erpline.aoacloud.com.tw"
+        self._base_url = BASE_URL
     
     async def initialize(self) -> Page:
         """初始化瀏覽器並返回頁面實例"""
         try:
-            self.playwright = await async_playwright().start()
-            
-            self.browser = await self.playwright.chromium.launch(
-                headless=self.headless,
-                args=[
-                    '--no-sandbox',
-                    '--disable-dev-shm-usage',
-                    '--disable-gpu',
-                    '--disable-web-security',
-                    '--use-fake-ui-for-media-stream',
-                    '--use-fake-device-for-media-stream'
-                ]
-            )
-            
-            # 創建新的context以便設置權限
-            context = await self.browser.new_context(
-                permissions=['geolocation'],
-                geolocation={
-                    'latitude': self.gps_config.latitude, 
-                    'longitude': self.gps_config.longitude
-                }
-            )
-            
-            self.page = await context.new_page()
+            if self.reuse_browser:
+                self.playwright, self.browser = await self._get_shared_browser(self.headless)
+            else:
+                self.playwright = await async_playwright().start()
+                self.browser = await self._launch_browser(self.playwright, self.headless)
             
-            await self.page.set_extra_http_headers({
-                'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 '
-                             '(KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36'
-            })
+            self.context = await self.new_context()
+            if self.reuse_browser:
+                BrowserManager._shared_refcount += 1
             
-            # 監聽並自動處理權限對話框
-            self.page.on('dialog', self._handle_dialog)
+            self.page = await self.context.new_page()
             
             logger.info("瀏覽器初始化完成")
             return self.page
             
         except Exception as e:
-            logger.error(f"瀏覽器初始化失敗: {e}")
+            logger.error("瀏覽器初始化失敗: {}", e)
             await self.cleanup()
             raise BrowserError(f"瀏覽器初始化失敗: {e}")
     
+    async def new_context(self) -> BrowserContext:
+        """在目前的瀏覽器上建立已設定定位、請求攔截與輔助腳本的 context"""
+        if self.browser is None:
+            raise BrowserError("瀏覽器尚未啟動")
+        
+        # 創建新的context以便設置權限
+        context = await self.browser.new_context(
+            user_agent=USER_AGENT,
+            permissions=['geolocation'],
+            geolocation={
+                'latitude': self.gps_config.latitude, 
+                'longitude': self.gps_config.longitude
+            }
+        )
+        
+        try:
+            # 監聽並自動處理權限對話框（套用到 context 內所有頁面）
+            context.on('dialog', self._handle_dialog)
+            
+            # 只攔截要封鎖的網址，其餘請求不經過 Python 處理
+            await context.route(self._blocked_url_pattern, self._abort_request)
+            
+            # 預先注入頁面檢查輔助函式，之後只需 evaluate 短小的呼叫運算式
+            await context.add_init_script(PAGE_HELPERS_SCRIPT)
+        except Exception:
+            await context.close()
+            raise
+        return context
+    
+    async def acquire_context(self) -> Page:
+        """從行程共用的瀏覽器取得新的 context 與頁面（必要時啟動瀏覽器）"""
+        self.reuse_browser = True
+        return await self.initialize()
+    
+    async def release_context(self) -> None:
+        """歸還 context：只關閉 context 與頁面，瀏覽器留給下一次使用"""
+        if self.context is None and self.page is None:
+            return
+        await self.cleanup_context_only()
+        BrowserManager._shared_refcount = max(0, BrowserManager._shared_refcount - 1)
+        self.browser = None
+        self.playwright = None
+        logger.info("瀏覽器 context 已關閉，保留共用瀏覽器")
+    
+    @staticmethod
+    async def _launch_browser(playwright: Playwright, headless: bool) -> Browser:
+        """啟動 Chromium 瀏覽器"""
+        return await playwright.chromium.launch(headless=headless, args=CHROMIUM_LAUNCH_ARGS)
+    
+    @classmethod
+    async def _get_shared_browser(cls, headless: bool) -> tuple[Playwright, Browser]:
+        """取得共用瀏覽器，必要時重新啟動"""
+        loop = asyncio.get_running_loop()
+        if cls._shared_lock is None or cls._shared_lock_loop is not loop:
+            cls._shared_lock = asyncio.Lock()
+            cls._shared_lock_loop = loop
+        
+        async with cls._shared_lock:
+            browser = cls._shared_browser
+            if (browser and browser.is_connected() and cls._shared_playwright
+                    and cls._shared_loop is loop and cls._shared_headless == headless):
+                logger.debug("重用已啟動的瀏覽器")
+                return cls._shared_playwright, browser
+            
+            if cls._shared_loop is not None and cls._shared_loop is not loop:
+                # 其他事件迴圈建立的 Playwright 物件無法在此關閉，只能捨棄參照
+                logger.warning("共用瀏覽器由其他事件迴圈建立，無法關閉，捨棄後重新啟動")
+                cls._clear_shared_state()
+            elif browser or cls._shared_playwright:
+                # 設定不符或連線中斷時，先關閉舊的瀏覽器再重新啟動；
+                # 仍有借出的 context 時不關閉連線中的瀏覽器，避免中斷使用中的工作
+                if browser and browser.is_connected() and cls._shared_refcount > 0:
+                    raise BrowserError(
+                        f"共用瀏覽器仍有 {cls._shared_refcount} 個 context 使用中，無法以不同設定重新啟動"
+                    )
+                await cls._close_shared_processes()
+            
+            playwright = await async_playwright().start()
+            cls._shared_playwright = playwright
+            cls._shared_browser = await cls._launch_browser(playwright, headless)
+            cls._shared_headless = headless
+            cls._shared_loop = loop
+            logger.info("已啟動共用瀏覽器")
+            return playwright, cls._shared_browser
+    
+    @classmethod
+    async def _close_shared_processes(cls) -> None:
+        """關閉共用的 Browser 與 Playwright，不變更借用計數"""
+        try:
+            if cls._shared_browser:
+                await cls._shared_browser.close()
+            if cls._shared_playwright:
+                await cls._shared_playwright.stop()
+            if cls._shared_browser or cls._shared_playwright:
+                logger.info("共用瀏覽器已關閉")
+        except Exception as e:
+            logger.error("關閉共用瀏覽器失敗: {}", e)
+        finally:
+            cls._shared_browser = None
+            cls._shared_playwright = None
+    
+    @classmethod
+    def _clear_shared_state(cls) -> None:
+        """清除共用瀏覽器的所有狀態"""
+        cls._shared_browser = None
+        cls._shared_playwright = None
+        cls._shared_headless = None
+        cls._shared_loop = None
+        cls._shared_refcount = 0
+    
+    @classmethod
+    async def shutdown_shared_browser(cls) -> None:
+        """關閉共用的瀏覽器行程"""
+        if cls._shared_refcount > 0:
+            logger.warning("關閉共用瀏覽器時仍有 {} 個 context 使用中", cls._shared_refcount)
+        try:
+            await cls._close_shared_processes()
+        finally:
+            cls._clear_shared_state()
+    
+    @staticmethod
+    async def _abort_request(route: Route) -> None:
+        """中止媒體、追蹤等非必要請求（只有符合攔截規則的網址會進到這裡）"""
+        await route.abort()
+    
     async def _handle_dialog(self, dialog):
         """處理瀏覽器對話框（如權限請求）"""
         try:
             dialog_type = dialog.type
             message = dialog.message
             
-            logger.info(f"檢測到對話框 - 類型: {dialog_type}, 訊息: {message}")
+            logger.info("檢測到對話框 - 類型: {}, 訊息: {}", dialog_type, message)
             
             # 自動接受所有對話框（包括權限請求）
             await dialog.accept()
             logger.info("已自動接受對話框")
             
         except Exception as e:
-            logger.error(f"處理對話框時發生錯誤: {e}")
+            logger.error("處理對話框時發生錯誤: {}", e)
             try:
                 await dialog.dismiss()
             except Exception:
@@ -102,7 +303,7 @@ class BrowserManager:
             return True
             
         except Exception as e:
-            logger.error(f"導航到基礎URL失敗: {e}")
+            logger.error("導航到基礎URL失敗: {}", e)
             return False
     
     async def wait_for_load_state(self, state: Literal['domcontentloaded', 'load', 'networkidle'] = 'networkidle', timeout: int = 15000):
@@ -114,15 +315,32 @@ class BrowserManager:
             await self.page.wait_for_load_state(state, timeout=timeout)
             return True
         except Exception as e:
-            logger.warning(f"等待載入狀態 {state} 超時: {e}")
+            logger.warning("等待載入狀態 {} 超時: {}", state, e)
             return False
     
-    async def cleanup(self) -> None:
-        """清理瀏覽器資源"""
+    async def cleanup_context_only(self) -> None:
+        """僅關閉 context 與頁面，保留瀏覽器行程"""
         try:
             if self.page:
                 await self.page.close()
                 self.page = None
+            if self.context:
+                await self.context.close()
+                self.context = None
+        except Exception as e:
+            logger.error("關閉瀏覽器 context 失敗: {}", e)
+            self.page = None
+            self.context = None
+    
+    async def cleanup(self) -> None:
+        """清理瀏覽器資源（共用瀏覽器只關閉 context）"""
+        if self.reuse_browser:
+            await self.release_context()
+            return
+        
+        await self.cleanup_context_only()
+        
+        try:
             if self.browser:
                 await self.browser.close()
                 self.browser = None
@@ -131,7 +349,7 @@ class BrowserManager:
                 self.playwright = None
             logger.info("瀏覽器資源清理完成")
         except Exception as e:
-            logger.error(f"瀏覽器資源清理失敗: {e}")
+            logger.error("瀏覽器資源清理失敗: {}", e)
     
     def get_page(self) -> Page:
         """獲取當前頁面實例"""
@@ -3,17 +3,60 @@
 負責檢查打卡頁面狀態和按鈕可用性
 """
 
-import asyncio
 from typing import Optional, Dict, Any
 from playwright.async_api import Page
+from playwright.async_api import TimeoutError as PlaywrightTimeoutError
 from loguru import logger
 
 
+# 頁面上已無 loading 遮罩與 spinner
+NO_LOADING_SCRIPT = "() => !document.querySelector('ion-loading') && !document.querySelector('.loading-spinner')"
+
+# GPS 定位完成後地址欄位會被填入
+ADDRESS_READY_SCRIPT = """
+() => {
+    const el = document.querySelector('#addressDiv ion-input input');
+    return !!(el && el.value && el.value.length > 0);
+}
+"""
+
+# 確認打卡頁面載入：回傳 'title'（標題含「打卡」）、'button'（簽到按鈕可見）或 null
+PAGE_LOADED_SCRIPT = """
+() => {
+    const title = document.querySelector('.toolbar-title');
+    if (title && title.textContent.includes('打卡')) return 'title';
+    const button = [...document.querySelectorAll('button')].find(b => b.textContent.includes('簽到'));
+    return button && button.offsetParent ? 'button' : null;
+}
+"""
+
+# 一次讀取日期與時間欄位（頁面上前兩個 .date 元素）
+TIME_INFO_SCRIPT = """
+() => {
+    const dates = document.querySelectorAll('.date');
+    return dates.length >= 2 ? [dates[0].textContent, dates[1].textContent] : [null, null];
+}
+"""
+
+# 簽到/簽退按鈕選擇器與顯示名稱
+BUTTON_SELECTORS = {
+    "sign_in": ('button:has-text("簽到")', "簽到"),
+    "sign_out": ('button:has-text("簽退")', "簽退"),
+}
+
+
 class StatusChecker:
     """狀態檢查器"""
     
     def __init__(self, page: Page):
         self.page = page
+        # 預先建立 locator，重複檢查時不必再解析選擇器字串
+        self._map_loc = page.locator('#divImap iframe').first
+        self._address_loc = page.locator('#addressDiv ion-input input').first
+        self._button_locs = {
+            button_type: page.locator(selector).first
+            for button_type, (selector, _) in BUTTON_SELECTORS.items()
+        }
     
     async def check_punch_page_status(self) -> dict:
         """檢查打卡頁面狀態和資訊"""
@@ -56,7 +99,7 @@ class StatusChecker:
             return status_info
             
         except Exception as e:
-            logger.error(f"檢查打卡頁面狀態失敗: {e}")
+            logger.error("檢查打卡頁面狀態失敗: {}", e)
             return {"error": str(e)}
     
     async def _wait_for_stable_page(self, timeout: int = 10000) -> bool:
@@ -64,49 +107,31 @@ class StatusChecker:
         try:
             logger.info("等待頁面穩定...")
             
-            max_wait_time = timeout / 1000
-            wait_interval = 0.5
-            elapsed_time = 0.0
-            
-            while elapsed_time < max_wait_time:
-                # 檢查是否有loading元素
-                loading_element = await self.page.query_selector('ion-loading')
-                if not loading_element:
-                    spinner_element = await self.page.query_selector('.loading-spinner')
-                    if not spinner_element:
-                        logger.info("頁面載入狀態穩定")
-                        break
-                
-                logger.debug(f"檢測到載入中...等待 {wait_interval} 秒")
-                await asyncio.sleep(wait_interval)
-                elapsed_time += wait_interval
-            
-            if elapsed_time >= max_wait_time:
+            try:
+                await self.page.wait_for_function(NO_LOADING_SCRIPT, timeout=timeout)
+                logger.info("頁面載入狀態穩定")
+            except PlaywrightTimeoutError:
                 logger.warning("等待頁面穩定超時，但繼續執行")
             
-            # 額外等待GPS定位完成
-            await asyncio.sleep(2)
+            # 等待GPS定位完成（地址欄位被填入）
+            try:
+                await self.page.wait_for_function(ADDRESS_READY_SCRIPT, timeout=5000)
+            except PlaywrightTimeoutError:
+                logger.debug("等待GPS地址逾時，繼續執行")
             return True
             
         except Exception as e:
-            logger.warning(f"等待頁面穩定時發生錯誤: {e}")
+            logger.warning("等待頁面穩定時發生錯誤: {}", e)
             return False
     
     async def _check_page_loaded(self) -> bool:
         """檢查頁面是否載入完成"""
         try:
-            # 首先檢查頁面標題
-            page_title = await self.page.text_content('.toolbar-title')
-            if page_title and "打卡" in page_title:
+            loaded_by = await self.page.evaluate(PAGE_LOADED_SCRIPT)
+            if loaded_by == 'title':
                 logger.info("打卡頁面載入確認（透過標題）")
                 return True
-        except Exception:
-            pass
-        
-        # 備用方案：透過簽到按鈕確認
-        try:
-            sign_in_button = await self.page.query_selector('button:has-text("簽到")')
-            if sign_in_button and await sign_in_button.is_visible():
+            if loaded_by == 'button':
                 logger.info("透過簽到按鈕確認頁面載入")
                 return True
         except Exception:
@@ -118,8 +143,7 @@ class StatusChecker:
     async def _check_gps_loaded(self) -> bool:
         """檢查GPS地圖是否載入"""
         try:
-            map_element = await self.page.query_selector('#divImap iframe')
-            if map_element:
+            if await self._map_loc.count():
                 logger.info("GPS地圖載入確認")
                 return True
         except Exception:
@@ -131,28 +155,25 @@ class StatusChecker:
     async def _get_time_info(self) -> dict:
         """獲取當前時間和日期"""
         try:
-            date_elements = await self.page.query_selector_all('.date')
-            if len(date_elements) >= 2:
-                current_date = await date_elements[0].text_content()
-                current_time = await date_elements[1].text_content()
-                logger.info(f"獲取時間資訊: {current_date} {current_time}")
+            current_date, current_time = await self.page.evaluate(TIME_INFO_SCRIPT)
+            if current_date is not None:
+                logger.info("獲取時間資訊: {} {}", current_date, current_time)
                 return {
                     "current_date": current_date,
                     "current_time": current_time
                 }
         except Exception as e:
-            logger.warning(f"無法獲取時間資訊: {e}")
+            logger.warning("無法獲取時間資訊: {}", e)
         
         return {"current_date": None, "current_time": None}
     
     async def _get_location_info(self) -> Optional[str]:
         """獲取地址資訊"""
         try:
-            address_input = await self.page.query_selector('#addressDiv ion-input input')
-            if address_input:
-                address_value = await address_input.get_attribute('value')
+            if await self._address_loc.count():
+                address_value = await self._address_loc.get_attribute('value')
                 if address_value:
-                    logger.info(f"GPS地址資訊: {address_value}")
+                    logger.info("GPS地址資訊: {}", address_value)
                     return address_value
         except Exception:
             pass
@@ -166,64 +187,47 @@ class StatusChecker:
             "sign_out_available": False
         }
         
-        # 檢查簽到按鈕
-        try:
-            sign_in_button = await self.page.query_selector('button:has-text("簽到")')
-            if sign_in_button:
-                is_visible = await sign_in_button.is_visible()
-                is_enabled = await sign_in_button.is_enabled()
-                button_status["sign_in_available"] = is_visible and is_enabled
-                logger.info(f"簽到按鈕狀態: 可見={is_visible}, 可用={is_enabled}")
-        except Exception as e:
-            logger.warning(f"無法檢查簽到按鈕狀態: {e}")
-        
-        # 檢查簽退按鈕
-        try:
-            sign_out_button = await self.page.query_selector('button:has-text("簽退")')
-            if sign_out_button:
-                is_visible = await sign_out_button.is_visible()
-                is_enabled = await sign_out_button.is_enabled()
-                button_status["sign_out_available"] = is_visible and is_enabled
-                logger.info(f"簽退按鈕狀態: 可見={is_visible}, 可用={is_enabled}")
-        except Exception as e:
-            logger.warning(f"無法檢查簽退按鈕狀態: {e}")
+        for button_type, (_, button_text) in BUTTON_SELECTORS.items():
+            try:
+                button = self._button_locs[button_type]
+                if await button.count():
+                    is_visible = await button.is_visible()
+                    is_enabled = await button.is_enabled()
+                    button_status[f"{button_type}_available"] = is_visible and is_enabled
+                    logger.info("{}按鈕狀態: 可見={}, 可用={}", button_text, is_visible, is_enabled)
+            except Exception as e:
+                logger.warning("無法檢查{}按鈕狀態: {}", button_text, e)
         
         return button_status
     
     def _log_status_summary(self, status_info: dict) -> None:
         """記錄狀態資訊摘要"""
         logger.info("打卡頁面狀態總結:")
-        logger.info(f"  - 頁面載入: {status_info['page_loaded']}")
-        logger.info(f"  - GPS地圖: {status_info['gps_loaded']}")
-        logger.info(f"  - 當前日期: {status_info['current_date']}")
-        logger.info(f"  - 當前時間: {status_info['current_time']}")
+        logger.info("  - 頁面載入: {}", status_info['page_loaded'])
+        logger.info("  - GPS地圖: {}", status_info['gps_loaded'])
+        logger.info("  - 當前日期: {}", status_info['current_date'])
+        logger.info("  - 當前時間: {}", status_info['current_time'])
         if status_info['location_info']:
-            logger.info(f"  - 地址資訊: {status_info['location_info']}")
-        logger.info(f"  - 簽到可用: {status_info['sign_in_available']}")
-        logger.info(f"  - 簽退可用: {status_info['sign_out_available']}")
+            logger.info("  - 地址資訊: {}", status_info['location_info'])
+        logger.info("  - 簽到可用: {}", status_info['sign_in_available'])
+        logger.info("  - 簽退可用: {}", status_info['sign_out_available'])
     
     async def check_button_availability(self, button_type: str) -> bool:
         """檢查特定按鈕的可用性"""
         try:
-            if button_type == "sign_in":
-                button_text = "簽到"
-            elif button_type == "sign_out":
-                button_text = "簽退"
-            else:
-                logger.error(f"不支援的按鈕類型: {button_type}")
+            button = self._button_locs.get(button_type)
+            if button is None:
+                logger.error("不支援的按鈕類型: {}", button_type)
                 return False
             
-            button_selector = f'button:has-text("{button_text}")'
-            button_element = await self.page.query_selector(button_selector)
-            
-            if not button_element:
+            if not await button.count():
                 return False
             
-            is_visible = await button_element.is_visible()
-            is_enabled = await button_element.is_enabled()
+            is_visible = await button.is_visible()
+            is_enabled = await button.is_enabled()
             
             return is_visible and is_enabled
             
         except Exception as e:
-            logger.error(f"檢查 {button_type} 按鈕可用性失敗: {e}")
+            logger.error("檢查 {} 按鈕可用性失敗: {}", button_type, e)
             return False
\ No newline at end of file
@@ -4,14 +4,68 @@
 """
 
 import asyncio
+import sys
+import time
 from datetime import datetime
+from typing import Dict, Optional, Tuple
 from playwright.async_api import Page
+from playwright.async_api import TimeoutError as PlaywrightTimeoutError
 from loguru import logger
 
 from src.models import PunchAction, PunchResult
 from .verifier import ResultVerifier
 
 
+# 打卡動作對應的按鈕選擇器
+_BUTTON_SELECTOR = {
+    PunchAction.SIGN_IN: 'button:has-text("簽到")',
+    PunchAction.SIGN_OUT: 'button:has-text("簽退")',
+}
+
+# 按鈕可用性檢查結果的有效時間（秒）
+_AVAILABILITY_CACHE_TTL = 2.0
+
+
+def _stdin_watchable(loop: asyncio.AbstractEventLoop) -> bool:
+    """檢查事件迴圈能否以 add_reader 監聽標準輸入（Windows 或 stdin 為一般檔案時不支援）"""
+    try:
+        fd = sys.stdin.fileno()
+        loop.add_reader(fd, lambda: None)
+    except (NotImplementedError, ValueError, OSError, AttributeError):
+        return False
+    loop.remove_reader(fd)
+    return True
+
+
+async def _read_line(prompt: str) -> str:
+    """非同步讀取一行標準輸入
+    
+    可監聽 stdin 時以 loop.add_reader 等待輸入，任務取消時移除監聽，不會留下讀取中的執行緒；
+    否則退回背景執行緒的 input()，該執行緒無法取消，呼叫端不應對其套用逾時。
+    """
+    loop = asyncio.get_running_loop()
+    if not _stdin_watchable(loop):
+        return await asyncio.to_thread(input, prompt)
+    
+    print(prompt, end='', flush=True)
+    fd = sys.stdin.fileno()
+    future: asyncio.Future[str] = loop.create_future()
+    
+    def on_readable() -> None:
+        if not future.done():
+            future.set_result(sys.stdin.readline())
+    
+    loop.add_reader(fd, on_readable)
+    try:
+        line = await future
+    finally:
+        loop.remove_reader(fd)
+    
+    if not line:
+        raise EOFError("標準輸入已關閉")
+    return line
+
+
 class PunchExecutor:
     """打卡執行器"""
     
@@ -19,48 +73,58 @@ class PunchExecutor:
         self.page = page
         self.interactive_mode = interactive_mode
         self.verifier = ResultVerifier(page)
+        # 快取各動作的按鈕 locator，檢查可用性與點擊共用同一個
+        self._locators = {
+            action: page.locator(selector).first for action, selector in _BUTTON_SELECTOR.items()
+        }
+        # 真實打卡確認結果，由 confirm()/cancel() 設定並喚醒等待中的協程
+        self._confirm_event = asyncio.Event()
+        self._confirm_result = False
+        # 按鈕可用性快取：action -> (檢查時間, 結果)
+        self._availability_cache: Dict[PunchAction, Tuple[float, dict]] = {}
     
     async def execute_punch_action(self, action: PunchAction, real_punch: bool = False, 
-                                  confirm: bool = False) -> PunchResult:
-        """執行打卡動作（真實或模擬）"""
+                                  confirm: bool = False, pre_state: Optional[dict] = None) -> PunchResult:
+        """執行打卡動作（真實或模擬）
+        
+        Args:
+            pre_state: 點擊前已取得的頁面狀態（StatusChecker 結果），供結果驗證沿用
+        """
         start_time = datetime.now()
         
         if real_punch and confirm:
-            return await self._execute_real_punch(action, start_time)
+            return await self._execute_real_punch(action, start_time, pre_state)
         else:
             return await self._execute_simulated_punch(action, start_time, not real_punch)
     
-    async def _execute_real_punch(self, action: PunchAction, start_time: datetime) -> PunchResult:
+    async def _execute_real_punch(self, action: PunchAction, start_time: datetime,
+                                  pre_state: Optional[dict] = None) -> PunchResult:
         """執行真實打卡操作"""
         try:
-            action_name = "簽到" if action == PunchAction.SIGN_IN else "簽退"
+            action_name = action.display_name
             logger.info(f"🎯 準備執行真實 {action_name} 操作...")
             
-            # 檢查按鈕是否可用
-            button_check = await self._check_button_availability(action)
-            if not button_check["available"]:
+            logger.info(f"🚀 執行真實 {action_name} 操作 - 點擊按鈕")
+            
+            # 實際點擊按鈕；click 本身會等待按鈕可見且可用，逾時即視為不可用
+            try:
+                await self._locators[action].click(timeout=10000)
+                # 點擊後按鈕狀態會改變，清除快取
+                self._availability_cache.clear()
+            except PlaywrightTimeoutError:
+                logger.warning(f"{action_name} 按鈕在時限內未變為可用")
                 return PunchResult(
                     success=False,
                     action=action,
                     timestamp=start_time,
-                    message=button_check["message"],
+                    message=f"{action_name} 按鈕不可用",
                     is_simulation=False
                 )
             
-            logger.info(f"🚀 執行真實 {action_name} 操作 - 點擊按鈕")
-            
-            # 實際點擊按鈕
-            button_text = "簽到" if action == PunchAction.SIGN_IN else "簽退"
-            button_selector = f'button:has-text("{button_text}")'
-            await self.page.click(button_selector)
-            
             logger.info(f"✅ 已點擊 {action_name} 按鈕，等待系統回應...")
             
-            # 等待系統處理
-            await asyncio.sleep(2)
-            
-            # 驗證打卡結果
-            verification_result = await self.verifier.verify_punch_result(action)
+            # 驗證打卡結果（由驗證器等待結果指示器出現）
+            verification_result = await self.verifier.verify_punch_result(action, pre_state=pre_state)
             
             return PunchResult(
                 success=verification_result["success"],
@@ -85,7 +149,7 @@ class PunchExecutor:
                                      is_simulation: bool) -> PunchResult:
         """執行模擬打卡操作"""
         try:
-            action_name = "簽到" if action == PunchAction.SIGN_IN else "簽退"
+            action_name = action.display_name
             logger.info(f"模擬 {action_name} 動作...")
             
             # 檢查按鈕是否可用
@@ -122,25 +186,28 @@ class PunchExecutor:
             )
     
     async def _check_button_availability(self, action: PunchAction) -> dict:
-        """檢查按鈕可用性"""
+        """檢查按鈕可用性（短時間內重複檢查直接沿用上次結果）"""
+        cached = self._availability_cache.get(action)
+        if cached and time.monotonic() - cached[0] < _AVAILABILITY_CACHE_TTL:
+            return cached[1]
+        
+        result = await self._probe_button_availability(action)
+        # 檢查過程發生錯誤時不快取，下次重新檢查
+        if "error" not in result:
+            self._availability_cache[action] = (time.monotonic(), result)
+        return result
+    
+    async def _probe_button_availability(self, action: PunchAction) -> dict:
+        """實際讀取按鈕狀態"""
         try:
-            button_text = "簽到" if action == PunchAction.SIGN_IN else "簽退"
-            action_name = "簽到" if action == PunchAction.SIGN_IN else "簽退"
+            action_name = action.display_name
+            button = self._locators[action]
             
             # 等待按鈕出現
-            button_selector = f'button:has-text("{button_text}")'
-            await self.page.wait_for_selector(button_selector, timeout=10000)
+            await button.wait_for(state='attached', timeout=10000)
             
             # 檢查按鈕狀態
-            button_element = await self.page.query_selector(button_selector)
-            if not button_element:
-                return {
-                    "available": False,
-                    "message": f"找不到 {action_name} 按鈕"
-                }
-            
-            is_visible = await button_element.is_visible()
-            is_enabled = await button_element.is_enabled()
+            is_visible, is_enabled = await asyncio.gather(button.is_visible(), button.is_enabled())
             
             logger.info(f"{action_name} 按鈕狀態 - 可見: {is_visible}, 可用: {is_enabled}")
             
@@ -165,13 +232,28 @@ class PunchExecutor:
             logger.error(f"檢查 {action.value} 按鈕可用性失敗: {e}")
             return {
                 "available": False,
-                "message": f"檢查按鈕時發生錯誤: {str(e)}"
+                "message": f"檢查按鈕時發生錯誤: {str(e)}",
+                "error": str(e)
             }
     
+    async def prepare_punch_button(self, action: PunchAction, timeout: int = 5000) -> None:
+        """預先將打卡按鈕捲動到可視範圍，可在等待用戶確認期間進行，縮短確認後的點擊延遲"""
+        try:
+            await self._locators[action].scroll_into_view_if_needed(timeout=timeout)
+        except Exception as e:
+            # 預備失敗不影響後續點擊，click 仍會自行等待按鈕
+            logger.debug(f"預備 {action.display_name} 按鈕失敗: {e}")
+    
     async def wait_for_punch_confirmation(self, action: PunchAction, timeout: int = 30000) -> bool:
-        """等待用戶確認執行真實打卡操作"""
+        """等待用戶確認執行真實打卡操作
+        
+        Args:
+            action: 打卡動作
+            timeout: 等待用戶輸入的逾時時間（毫秒），逾時視為取消；
+                無法監聽標準輸入時改用阻塞式 input()，不套用逾時
+        """
         try:
-            action_name = "簽到" if action == PunchAction.SIGN_IN else "簽退"
+            action_name = action.display_name
             
             logger.info(f"⚠️ 準備執行真實 {action_name} 操作")
             logger.info("🔔 這將會實際點擊打卡按鈕，請確認您要執行此操作")
@@ -180,19 +262,33 @@ class PunchExecutor:
             # 在交互式模式下，詢問用戶確認
             if self.interactive_mode:
                 try:
-                    print(f"\n⚠️  警告：即將執行真實 {action_name} 操作")
-                    print("這將會實際點擊震旦HR系統的打卡按鈕")
-                    print("如果您不想實際打卡，請選擇 'n' 或直接按 Enter 取消")
+                    print(f"\n⚠️  警告：即將執行真實 {action_name} 操作\n"
+                          "這將會實際點擊震旦HR系統的打卡按鈕\n"
+                          "如果您不想實際打卡，請選擇 'n' 或直接按 Enter 取消")
                     
-                    response = input(f"確定要執行真實 {action_name} 嗎？ (輸入 'yes' 確認，其他任何輸入都將取消): ").strip().lower()
+                    # 由背景任務讀取輸入並設定確認事件；其他協程也可透過 confirm()/cancel() 回應
+                    prompt = f"確定要執行真實 {action_name} 嗎？ (輸入 'yes' 確認，其他任何輸入都將取消): "
+                    self._confirm_event.clear()
+                    # 阻塞式 input() 無法在逾時後中止，只在可監聽 stdin 時套用逾時
+                    wait_timeout = timeout / 1000 if _stdin_watchable(asyncio.get_running_loop()) else None
+                    input_task = asyncio.create_task(self._read_confirmation_input(prompt))
+                    try:
+                        await asyncio.wait_for(self._confirm_event.wait(), timeout=wait_timeout)
+                    finally:
+                        # 事件可能由 confirm()/cancel() 提前設定，確保 stdin 監聽在返回前已移除
+                        input_task.cancel()
+                        await asyncio.gather(input_task, return_exceptions=True)
                     
-                    if response == 'yes':
+                    if self._confirm_result:
                         logger.info(f"✅ 用戶確認執行真實 {action_name} 操作")
                         return True
                     else:
                         logger.info(f"❌ 用戶取消真實 {action_name} 操作")
                         return False
                         
+                except asyncio.TimeoutError:
+                    logger.warning(f"⏰ 等待用戶確認逾時 ({timeout / 1000:.0f} 秒)，取消真實 {action_name} 操作")
+                    return False
                 except Exception as input_error:
                     logger.error(f"獲取用戶輸入時發生錯誤: {input_error}")
                     return False
@@ -206,6 +302,30 @@ class PunchExecutor:
             logger.error(f"等待用戶確認時發生錯誤: {e}")
             return False
     
+    async def _read_confirmation_input(self, prompt: str) -> None:
+        """讀取用戶輸入並設定確認結果，不阻塞事件迴圈"""
+        try:
+            response = (await _read_line(prompt)).strip().lower()
+        except Exception as input_error:
+            logger.error(f"獲取用戶輸入時發生錯誤: {input_error}")
+            self.cancel()
+            return
+        
+        if response == 'yes':
+            self.confirm()
+        else:
+            self.cancel()
+    
+    def confirm(self) -> None:
+        """確認執行真實打卡操作"""
+        self._confirm_result = True
+        self._confirm_event.set()
+    
+    def cancel(self) -> None:
+        """取消真實打卡操作"""
+        self._confirm_result = False
+        self._confirm_event.set()
+    
     def set_interactive_mode(self, interactive: bool = True):
         """設定是否為交互式模式"""
         self.interactive_mode = interactive
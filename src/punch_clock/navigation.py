@@ -3,11 +3,17 @@
 負責處理頁面導航和GPS定位
 """
 
-import asyncio
 from playwright.async_api import Page
+from playwright.async_api import TimeoutError as PlaywrightTimeoutError
 from loguru import logger
 
 from src.retry_handler import retry_on_error, NavigationError
+from .browser import PAGE_INFO_EXPRESSION
+from .checker import ADDRESS_READY_SCRIPT
+
+
+# 主頁面的出勤打卡圖示（依文字或圖示圖片）
+PUNCH_CARD_SELECTOR = 'ion-col:has(p:text("出勤打卡")), ion-col:has(img[src*="home_01"])'
 
 
 class NavigationHandler:
@@ -15,6 +21,12 @@ class NavigationHandler:
     
     def __init__(self, page: Page):
         self.page = page
+        # 快取常用元素的 locator，避免每次重新解析選擇器
+        self._punch_card_loc = page.locator(PUNCH_CARD_SELECTOR).first
+        self._title_loc = page.locator('.toolbar-title').first
+        self._sign_in_loc = page.locator('button:has-text("簽到")').first
+        self._map_loc = page.locator('#divImap')
+        self._fab_loc = page.locator('ion-fab button[ion-fab]').first
     
     @retry_on_error(max_attempts=3, base_delay=1.5, error_context="導航到打卡頁面")
     async def navigate_to_punch_page(self) -> bool:
@@ -22,8 +34,8 @@ class NavigationHandler:
         try:
             logger.info("準備導航到出勤打卡頁面...")
             
-            # 等待主頁面載入完成
-            await self.page.wait_for_load_state('networkidle', timeout=10000)
+            # 等待主頁面 DOM 載入完成（圖示本身由 _click_punch_card_icon 等待）
+            await self.page.wait_for_load_state('domcontentloaded', timeout=10000)
             
             # 尋找並點擊出勤打卡圖示
             if not await self._click_punch_card_icon():
@@ -54,22 +66,12 @@ class NavigationHandler:
     async def _click_punch_card_icon(self) -> bool:
         """尋找並點擊出勤打卡圖示"""
         try:
-            # 主要選擇器
-            punch_card_selector = 'ion-col:has(p:text("出勤打卡"))'
-            
-            # 嘗試主要選擇器
-            try:
-                await self.page.wait_for_selector(punch_card_selector, timeout=10000)
-                logger.info("找到出勤打卡圖示")
-            except Exception:
-                # 如果找不到，嘗試替代選擇器
-                alternative_selector = 'ion-col:has(img[src*="home_01"])'
-                await self.page.wait_for_selector(alternative_selector, timeout=5000)
-                punch_card_selector = alternative_selector
-                logger.info("使用替代選擇器找到出勤打卡圖示")
+            # 文字與圖示兩種選擇器合併，一次等待任一出現
+            await self._punch_card_loc.wait_for(timeout=10000)
+            logger.info("找到出勤打卡圖示")
             
             # 點擊出勤打卡圖示
-            await self.page.click(punch_card_selector)
+            await self._punch_card_loc.click()
             logger.info("已點擊出勤打卡圖示")
             return True
             
@@ -82,8 +84,8 @@ class NavigationHandler:
         try:
             # 等待頁面標題出現，確認已到達打卡頁面
             try:
-                await self.page.wait_for_selector('.toolbar-title', timeout=10000)
-                page_title = await self.page.text_content('.toolbar-title')
+                await self._title_loc.wait_for(timeout=10000)
+                page_title = await self._title_loc.text_content()
                 if page_title and "打卡" in page_title:
                     logger.info("透過頁面標題確認已到達打卡頁面")
                     return True
@@ -92,7 +94,7 @@ class NavigationHandler:
             
             # 備用驗證：查找打卡按鈕
             try:
-                await self.page.wait_for_selector('button:has-text("簽到")', timeout=5000)
+                await self._sign_in_loc.wait_for(timeout=5000)
                 logger.info("透過簽到按鈕確認已到達打卡頁面")
                 return True
             except Exception:
@@ -112,7 +114,7 @@ class NavigationHandler:
             
             # 等待地圖容器出現
             try:
-                await self.page.wait_for_selector('#divImap', timeout=8000)
+                await self._map_loc.wait_for(timeout=8000)
                 logger.info("地圖容器已載入")
             except Exception:
                 logger.warning("地圖容器載入超時")
@@ -120,9 +122,12 @@ class NavigationHandler:
             # 主動觸發GPS定位（點擊定位按鈕）
             await self._trigger_gps_location()
             
-            # 等待GPS定位完成
-            await asyncio.sleep(3)
-            logger.info("GPS定位等待完成")
+            # 等待GPS定位完成（地址欄位被填入）
+            try:
+                await self.page.wait_for_function(ADDRESS_READY_SCRIPT, timeout=5000)
+                logger.info("GPS定位等待完成")
+            except PlaywrightTimeoutError:
+                logger.warning("GPS定位等待逾時，但繼續執行")
             
         except Exception as e:
             logger.warning(f"GPS定位處理失敗，但繼續執行: {e}")
@@ -130,11 +135,9 @@ class NavigationHandler:
     async def _trigger_gps_location(self) -> None:
         """主動觸發GPS定位"""
         try:
-            locate_button = await self.page.query_selector('ion-fab button[ion-fab]')
-            if locate_button and await locate_button.is_visible():
+            if await self._fab_loc.is_visible():
                 logger.info("找到定位按鈕，主動觸發GPS定位")
-                await locate_button.click()
-                await asyncio.sleep(2)  # 等待定位請求
+                await self._fab_loc.click()
                 logger.info("已觸發GPS定位")
             else:
                 logger.info("未找到定位按鈕")
@@ -144,14 +147,9 @@ class NavigationHandler:
     async def _wait_for_loading_complete(self) -> None:
         """等待loading spinner消失"""
         try:
-            loading_selector = 'ion-loading'
-            loading_element = await self.page.query_selector(loading_selector)
-            if loading_element:
-                logger.info("檢測到loading狀態，等待完成...")
-                await self.page.wait_for_selector(loading_selector, state='detached', timeout=10000)
-                logger.info("Loading完成")
-            else:
-                logger.info("沒有檢測到loading狀態")
+            # state='detached' 在元素本就不存在時會立即返回
+            await self.page.wait_for_selector('ion-loading', state='detached', timeout=10000)
+            logger.info("Loading完成")
         except Exception as e:
             logger.info(f"Loading等待超時或完成: {e}")
     
@@ -160,34 +158,15 @@ class NavigationHandler:
         try:
             # 獲取基本頁面資訊
             current_url = self.page.url
-            page_title = ""
             
-            try:
-                title_element = await self.page.query_selector('.toolbar-title')
-                if title_element:
-                    page_title = await title_element.text_content() or ""
-            except Exception:
-                pass
-            
-            # 檢查是否在打卡頁面
-            is_punch_page = False
-            if "打卡" in page_title or await self.page.query_selector('button:has-text("簽到")'):
-                is_punch_page = True
-            
-            # 檢查GPS地圖狀態
-            gps_loaded = False
-            try:
-                map_element = await self.page.query_selector('#divImap iframe')
-                if map_element:
-                    gps_loaded = True
-            except Exception:
-                pass
+            # 一次 evaluate 取得標題、是否為打卡頁面與GPS地圖狀態
+            info = await self.page.evaluate(PAGE_INFO_EXPRESSION)
             
             return {
                 "url": current_url,
-                "title": page_title.strip(),
-                "is_punch_page": is_punch_page,
-                "gps_loaded": gps_loaded
+                "title": info["title"],
+                "is_punch_page": info["isPunchPage"],
+                "gps_loaded": info["gpsLoaded"]
             }
             
         except Exception as e:
@@ -203,7 +182,7 @@ class NavigationHandler:
     async def refresh_page(self) -> bool:
         """重新整理頁面"""
         try:
-            await self.page.reload(wait_until='networkidle')
+            await self.page.reload(wait_until='domcontentloaded')
             logger.info("頁面重新整理完成")
             return True
         except Exception as e:
@@ -213,7 +192,7 @@ class NavigationHandler:
     async def go_back(self) -> bool:
         """返回上一頁"""
         try:
-            await self.page.go_back(wait_until='networkidle')
+            await self.page.go_back(wait_until='domcontentloaded')
             logger.info("已返回上一頁")
             return True
         except Exception as e:
@@ -3,9 +3,11 @@
 負責處理截圖功能和檔案管理
 """
 
+import asyncio
+import os
 from datetime import datetime
 from pathlib import Path
-from typing import List, Optional
+from typing import List, Literal, Optional, Set
 from playwright.async_api import Page
 from loguru import logger
 
@@ -19,27 +21,52 @@ class ScreenshotManager:
         self.screenshots_dir = Path(screenshots_dir)
         self._screenshot_counter = 0
         self._screenshots_taken: List[Path] = []
+        # 尚未寫入磁碟的截圖（背景執行緒寫檔）
+        self._pending_writes: Set[asyncio.Task] = set()
+        
+        # 截圖檔案路徑前綴，組檔名時直接串接字串
+        self._path_prefix = os.path.join(str(self.screenshots_dir), "")
         
         # 建立截圖目錄
         if self.enable_screenshots:
-            self.screenshots_dir.mkdir(exist_ok=True)
+            self.screenshots_dir.mkdir(parents=True, exist_ok=True)
             logger.info(f"截圖將保存到: {self.screenshots_dir}")
     
-    async def take_screenshot(self, step_name: str, description: str = "") -> Optional[Path]:
-        """截取頁面截圖"""
+    async def take_screenshot(self, step_name: str, description: str = "", full_page: bool = False,
+                              image_format: Literal["jpeg", "png"] = "jpeg", quality: int = 60) -> Optional[Path]:
+        """截取頁面截圖
+        
+        Args:
+            step_name: 步驟名稱（用於檔名）
+            description: 截圖描述
+            full_page: 是否截取整個可捲動頁面，預設只截可視範圍
+            image_format: 影像格式（"jpeg" 或 "png"）
+            quality: JPEG 品質（0-100），PNG 時忽略
+        """
         if not self.enable_screenshots or not self.page:
             return None
         
         try:
             self._screenshot_counter += 1
             timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-            filename = f"{self._screenshot_counter:02d}_{timestamp}_{step_name}.png"
-            screenshot_path = self.screenshots_dir / filename
+            suffix = "jpg" if image_format == "jpeg" else image_format
+            filename = f"{self._screenshot_counter:02d}_{timestamp}_{step_name}.{suffix}"
+            screenshot_file = self._path_prefix + filename
+            
+            # 先在記憶體取得影像，再交給背景執行緒寫檔，頁面操作不必等待磁碟 I/O
+            if image_format == "jpeg":
+                image_bytes = await self.page.screenshot(type="jpeg", quality=quality, full_page=full_page)
+            else:
+                image_bytes = await self.page.screenshot(type=image_format, full_page=full_page)
+            write_task = asyncio.create_task(asyncio.to_thread(self._write_file, screenshot_file, image_bytes))
+            self._pending_writes.add(write_task)
+            write_task.add_done_callback(self._on_write_done)
             
-            await self.page.screenshot(path=str(screenshot_path), full_page=True)
+            # 對外仍提供 Path
+            screenshot_path = Path(screenshot_file)
             self._screenshots_taken.append(screenshot_path)
             
-            log_msg = f"截圖已保存: {screenshot_path}"
+            log_msg = f"截圖已保存: {screenshot_file}"
             if description:
                 log_msg += f" - {description}"
             logger.info(log_msg)
@@ -50,9 +77,32 @@ class ScreenshotManager:
             logger.error(f"截圖失敗: {e}")
             return None
     
+    @staticmethod
+    def _write_file(file_path: str, data: bytes) -> None:
+        """寫入截圖檔案（目錄在執行期間被刪除或輪替時重新建立）"""
+        try:
+            f = open(file_path, 'wb')
+        except FileNotFoundError:
+            Path(file_path).parent.mkdir(parents=True, exist_ok=True)
+            f = open(file_path, 'wb')
+        with f:
+            f.write(data)
+    
+    def _on_write_done(self, task: asyncio.Task) -> None:
+        """背景寫檔完成回呼"""
+        self._pending_writes.discard(task)
+        if not task.cancelled() and task.exception():
+            logger.error(f"截圖寫入失敗: {task.exception()}")
+    
+    async def flush(self) -> None:
+        """等待所有背景截圖寫入完成"""
+        if self._pending_writes:
+            await asyncio.gather(*self._pending_writes, return_exceptions=True)
+    
     async def take_error_screenshot(self, error_context: str) -> Optional[Path]:
         """發生錯誤時截取頁面截圖"""
-        return await self.take_screenshot("error", f"錯誤狀況: {error_context}")
+        # 錯誤截圖保留整頁內容以便診斷
+        return await self.take_screenshot("error", f"錯誤狀況: {error_context}", full_page=True)
     
     def get_screenshots_taken(self) -> List[Path]:
         """獲取已截取的截圖列表"""
@@ -72,16 +122,13 @@ class ScreenshotManager:
         self._screenshot_counter = 0
         logger.info("截圖記錄已清空")
     
-    def delete_screenshots(self) -> int:
+    async def delete_screenshots(self) -> int:
         """刪除所有截圖檔案"""
-        deleted_count = 0
-        for screenshot_path in self._screenshots_taken:
-            try:
-                if screenshot_path.exists():
-                    screenshot_path.unlink()
-                    deleted_count += 1
-            except Exception as e:
-                logger.error(f"刪除截圖失敗 {screenshot_path}: {e}")
+        await self.flush()
+        results = await asyncio.gather(
+            *(asyncio.to_thread(self._safe_unlink, screenshot_path) for screenshot_path in self._screenshots_taken)
+        )
+        deleted_count = sum(results)
         
         if deleted_count > 0:
             logger.info(f"已刪除 {deleted_count} 個截圖檔案")
@@ -89,10 +136,28 @@ class ScreenshotManager:
         self.clear_screenshots()
         return deleted_count
     
-    def get_screenshots_info(self) -> List[dict]:
+    @staticmethod
+    def _safe_unlink(screenshot_path: Path) -> int:
+        """刪除單一截圖檔案，成功回傳 1，不存在或失敗回傳 0"""
+        try:
+            screenshot_path.unlink()
+            return 1
+        except FileNotFoundError:
+            return 0
+        except OSError as e:
+            logger.error(f"刪除截圖失敗 {screenshot_path}: {e}")
+            return 0
+    
+    async def get_screenshots_info(self) -> List[dict]:
         """獲取截圖資訊列表"""
+        await self.flush()
+        return await asyncio.to_thread(self._collect_screenshots_info, list(self._screenshots_taken))
+    
+    @staticmethod
+    def _collect_screenshots_info(screenshot_paths: List[Path]) -> List[dict]:
+        """讀取截圖檔案資訊（每個檔案只 stat 一次）"""
         screenshots_info = []
-        for screenshot_path in self._screenshots_taken:
+        for screenshot_path in screenshot_paths:
             try:
                 stat = screenshot_path.stat()
                 screenshots_info.append({
@@ -100,7 +165,15 @@ class ScreenshotManager:
                     "name": screenshot_path.name,
                     "size": stat.st_size,
                     "created": datetime.fromtimestamp(stat.st_ctime),
-                    "exists": screenshot_path.exists()
+                    "exists": True
+                })
+            except FileNotFoundError:
+                screenshots_info.append({
+                    "path": screenshot_path,
+                    "name": screenshot_path.name,
+                    "size": 0,
+                    "created": None,
+                    "exists": False
                 })
             except Exception as e:
                 screenshots_info.append({
@@ -111,4 +184,4 @@ class ScreenshotManager:
                     "exists": False,
                     "error": str(e)
                 })
-        return screenshots_info
\ No newline at end of file
+        return screenshots_info
@@ -3,15 +3,20 @@
 提供統一的打卡流程執行接口
 """
 
-import base64
+import asyncio
+import contextlib
 import json
+import os
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
+from html import escape
 from pathlib import Path
-from typing import Optional, Union
+from typing import Dict, Iterable, List, NamedTuple, Optional, Union
 from loguru import logger
 
 from src.models import LoginCredentials, PunchAction, PunchResult, GPSConfig, VisualTestResult, TestStep, ScreenshotInfo, WebhookConfig
 from src.webhook import WebhookManager
+from src.retry_handler import PunchClockError
 from .browser import BrowserManager
 from .auth import AuthHandler
 from .navigation import NavigationHandler
@@ -19,6 +24,107 @@ from .executor import PunchExecutor
 from .checker import StatusChecker
 from .screenshot import ScreenshotManager
 
+_AVAILABLE_KEY = {PunchAction.SIGN_IN: "sign_in_available", PunchAction.SIGN_OUT: "sign_out_available"}
+
+
+# 報告 JSON 序列化：優先使用 orjson，未安裝時改用標準庫 json
+try:
+    from orjson import OPT_INDENT_2, dumps as _orjson_dumps
+    
+    def _dump_report_json(data: dict) -> bytes:
+        """將報告資料序列化為縮排的 UTF-8 JSON"""
+        return _orjson_dumps(data, option=OPT_INDENT_2)
+except ImportError:
+    def _dump_report_json(data: dict) -> bytes:
+        """將報告資料序列化為縮排的 UTF-8 JSON"""
+        return json.dumps(data, indent=2, ensure_ascii=False).encode('utf-8')
+
+
+class _Handlers(NamedTuple):
+    """__aenter__ 建立的各處理器（已確認皆非 None）"""
+    auth: AuthHandler
+    navigation: NavigationHandler
+    status_checker: StatusChecker
+    punch_executor: PunchExecutor
+
+# 內嵌截圖時同時讀取編碼的最大檔案數
+_MAX_IMAGE_READS = 16
+
+# HTML報告的固定頁首（樣式與腳本）與頁尾，只建立一次
+_HTML_HEAD = """<!DOCTYPE html>
+<html lang="zh-TW">
+<head>
+    <meta charset="UTF-8">
+    <meta name="viewport" content="width=device-width, initial-scale=1.0">
+    <title>震旦HR自動打卡 - 視覺化測試報告</title>
+    <style>
+        body { font-family: sans-serif; margin: 20px; background: #f5f5f5; }
+        .container { max-width: 1200px; margin: 0 auto; background: white; padding: 30px; border-radius: 10px; }
+        .header { text-align: center; margin-bottom: 30px; padding-bottom: 20px; border-bottom: 2px solid #eee; }
+        .summary { display: grid; grid-template-columns: repeat(auto-fit, minmax(200px, 1fr)); gap: 20px; margin-bottom: 30px; }
+        .summary-card { background: #f8f9fa; padding: 20px; border-radius: 8px; text-align: center; }
+        .summary-card.success { border-left: 4px solid #28a745; }
+        .summary-card.error { border-left: 4px solid #dc3545; }
+        .summary-card .value { font-size: 2em; font-weight: bold; color: #2c3e50; }
+        .step { border: 1px solid #dee2e6; border-radius: 8px; margin-bottom: 15px; }
+        .step-header { padding: 15px 20px; background: #f8f9fa; cursor: pointer; }
+        .step-header.success { border-left: 4px solid #28a745; }
+        .step-header.error { border-left: 4px solid #dc3545; }
+        .step-content { padding: 20px; display: none; }
+        .step-content.show { display: block; }
+        .screenshot { max-width: 100%; border: 1px solid #dee2e6; border-radius: 4px; margin: 10px 0; }
+        .status-badge { padding: 4px 12px; border-radius: 4px; color: white; font-size: 0.9em; font-weight: bold; }
+        .status-success { background-color: #28a745; }
+        .status-error { background-color: #dc3545; }
+        .screenshots-grid { display: grid; grid-template-columns: repeat(auto-fill, minmax(300px, 1fr)); gap: 20px; margin-top: 30px; }
+        .screenshot-card { border: 1px solid #dee2e6; border-radius: 8px; overflow: hidden; }
+        .screenshot-card img { width: 100%; height: auto; }
+        .screenshot-info { padding: 15px; background: #f8f9fa; }
+    </style>
+    <script>
+        function toggleStep(element) {
+            const content = element.nextElementSibling;
+            content.classList.toggle("show");
+        }
+    </script>
+</head>
+<body>
+    <div class="container">
+"""
+
+_HTML_FOOT = """            </div>
+        </div>
+    </div>
+</body>
+</html>
+"""
+
+# 步驟與截圖卡片的HTML模板，欄位值需先經過 escape
+_STEP_TEMPLATE = """            <div class="step">
+                <div class="step-header {status_class}" onclick="toggleStep(this)">
+                    <div>
+                        <strong>{index}. {description}</strong>
+                        <small style="color: #6c757d; margin-left: 10px;">{time}</small>
+                    </div>
+                    <span class="status-badge {status_badge_class}">{status_text}</span>
+                </div>
+                <div class="step-content">
+                    <p><strong>步驟名稱:</strong> {step_name}</p>
+                    {error_html}
+                    {screenshot_html}
+                </div>
+            </div>
+"""
+
+_SCREENSHOT_TEMPLATE = """                <div class="screenshot-card">
+                    <img src="{src}" alt="{description}">
+                    <div class="screenshot-info">
+                        <strong>{description}</strong><br>
+                        <small>{time}</small>
+                    </div>
+                </div>
+"""
+
 
 class PunchClockService:
     """打卡服務主接口"""
@@ -26,13 +132,14 @@ class PunchClockService:
     def __init__(self, headless: bool = True, enable_screenshots: bool = False, 
                  screenshots_dir: str = "screenshots", gps_config: Optional[GPSConfig] = None,
                  interactive_mode: bool = False, webhook_config: Optional[WebhookConfig] = None,
-                 scheduler_mode: bool = False):
+                 scheduler_mode: bool = False, reuse_browser: bool = False):
         self.headless = headless
         self.enable_screenshots = enable_screenshots
         self.screenshots_dir = screenshots_dir
         self.gps_config = gps_config or GPSConfig()
         self.interactive_mode = interactive_mode
         self.scheduler_mode = scheduler_mode  # 排程器模式，自動確認真實打卡
+        self.reuse_browser = reuse_browser  # 重用共用瀏覽器行程，僅重建 context
         
         # Webhook 管理器
         self.webhook_manager: Optional[WebhookManager] = None
@@ -77,27 +184,23 @@ class PunchClockService:
         
         try:
             async with self:
+                handlers = self._require_handlers()
+                
                 # 步驟1: 登入
                 logger.info("🔐 執行登入...")
-                if not self.auth_handler:
-                    return self._create_error_result(action, start_time, "AuthHandler 未初始化")
-                login_success = await self.auth_handler.login(credentials)
+                login_success = await handlers.auth.login(credentials)
                 if not login_success:
                     return self._create_error_result(action, start_time, "登入失敗")
                 
                 # 步驟2: 導航到打卡頁面
                 logger.info("🧭 導航到打卡頁面...")
-                if not self.navigation_handler:
-                    return self._create_error_result(action, start_time, "NavigationHandler 未初始化")
-                navigation_success = await self.navigation_handler.navigate_to_punch_page()
+                navigation_success = await handlers.navigation.navigate_to_punch_page()
                 if not navigation_success:
                     return self._create_error_result(action, start_time, "導航到打卡頁面失敗")
                 
                 # 步驟3: 檢查頁面狀態
                 logger.info("🔍 檢查打卡頁面狀態...")
-                if not self.status_checker:
-                    return self._create_error_result(action, start_time, "StatusChecker 未初始化")
-                page_status = await self.status_checker.check_punch_page_status()
+                page_status = await handlers.status_checker.check_punch_page_status()
                 if page_status.get("error"):
                     return self._create_error_result(action, start_time, f"頁面狀態檢查失敗: {page_status['error']}")
                 
@@ -121,15 +224,14 @@ class PunchClockService:
         
         try:
             async with self:
+                handlers = self._require_handlers()
+                
                 # 記錄瀏覽器初始化
                 await self._add_test_step(test_result, "browser_init", "瀏覽器初始化", True)
                 await self._wait_for_user_input("瀏覽器已初始化，準備執行登入")
                 
                 # 步驟1: 登入測試
-                if not self.auth_handler:
-                    await self._add_test_step(test_result, "auth_error", "AuthHandler 未初始化", False, "AuthHandler 未初始化")
-                    return self._finalize_test_result(test_result)
-                login_success = await self.auth_handler.login(credentials)
+                login_success = await handlers.auth.login(credentials)
                 await self._add_test_step(test_result, "login", "執行登入操作", login_success, 
                                   None if login_success else "登入失敗")
                 
@@ -139,10 +241,7 @@ class PunchClockService:
                 await self._wait_for_user_input("登入成功，準備導航到打卡頁面")
                 
                 # 步驟2: 導航測試
-                if not self.navigation_handler:
-                    await self._add_test_step(test_result, "navigation_error", "NavigationHandler 未初始化", False, "NavigationHandler 未初始化")
-                    return self._finalize_test_result(test_result)
-                navigation_success = await self.navigation_handler.navigate_to_punch_page()
+                navigation_success = await handlers.navigation.navigate_to_punch_page()
                 await self._add_test_step(test_result, "navigation", "導航到出勤打卡頁面", navigation_success,
                                   None if navigation_success else "導航失敗")
                 
@@ -152,10 +251,7 @@ class PunchClockService:
                 await self._wait_for_user_input("已到達打卡頁面，準備檢查頁面狀態")
                 
                 # 步驟3: 狀態檢查測試
-                if not self.status_checker:
-                    await self._add_test_step(test_result, "status_error", "StatusChecker 未初始化", False, "StatusChecker 未初始化")
-                    return self._finalize_test_result(test_result)
-                page_status = await self.status_checker.check_punch_page_status()
+                page_status = await handlers.status_checker.check_punch_page_status()
                 status_success: bool = not page_status.get("error") and bool(
                     page_status.get("sign_in_available") or page_status.get("sign_out_available")
                 )
@@ -183,8 +279,8 @@ class PunchClockService:
     async def _execute_single_action(self, action: PunchAction, real_punch: bool, 
                                    page_status: dict) -> PunchResult:
         """執行單個打卡動作"""
-        action_name = "簽到" if action == PunchAction.SIGN_IN else "簽退"
-        available_key = 'sign_in_available' if action == PunchAction.SIGN_IN else 'sign_out_available'
+        action_name = action.display_name
+        available_key = _AVAILABLE_KEY[action]
         
         if not page_status.get(available_key, False):
             logger.warning(f"⚠️ {action_name} 按鈕不可用")
@@ -197,15 +293,8 @@ class PunchClockService:
             )
         
         # 設定交互式模式
-        if not self.punch_executor:
-            return PunchResult(
-                success=False,
-                action=action,
-                timestamp=datetime.now(),
-                message="PunchExecutor 未初始化",
-                is_simulation=True
-            )
-        self.punch_executor.set_interactive_mode(self.interactive_mode)
+        punch_executor = self._require_handlers().punch_executor
+        punch_executor.set_interactive_mode(self.interactive_mode)
         
         if real_punch:
             # 根據模式決定是否需要用戶確認
@@ -214,12 +303,20 @@ class PunchClockService:
                 logger.info("🤖 排程器模式：直接執行真實打卡操作")
                 confirm = True
             else:
-                # 手動模式：等待用戶確認
-                confirm = await self.punch_executor.wait_for_punch_confirmation(action)
-            result = await self.punch_executor.execute_punch_action(action, True, confirm)
+                # 手動模式：等待用戶確認，同時預備打卡按鈕
+                prepare_task = asyncio.create_task(punch_executor.prepare_punch_button(action))
+                confirm = await punch_executor.wait_for_punch_confirmation(action)
+                if confirm:
+                    await prepare_task
+                else:
+                    prepare_task.cancel()
+                    # 等待預備工作結束，避免與後續頁面操作交錯
+                    with contextlib.suppress(asyncio.CancelledError):
+                        await prepare_task
+            result = await punch_executor.execute_punch_action(action, True, confirm, pre_state=page_status)
         else:
             # 模擬模式
-            result = await self.punch_executor.execute_punch_action(action, False, False)
+            result = await punch_executor.execute_punch_action(action, False, False)
         
         # 發送 webhook 通知（僅在真實打卡模式下）
         if real_punch and self.webhook_manager:
@@ -238,26 +335,27 @@ class PunchClockService:
                 is_simulation=False
             )
         
-        if not self.punch_executor:
-            return PunchResult(
+        punch_executor = self._require_handlers().punch_executor
+        
+        # 模擬只讀取各自按鈕的狀態，簽到與簽退可同時進行
+        actions = [
+            action for action, available_key in _AVAILABLE_KEY.items()
+            if page_status.get(available_key)
+        ]
+        outcomes = await asyncio.gather(
+            *(punch_executor.execute_punch_action(action, False, False) for action in actions),
+            return_exceptions=True
+        )
+        results = [
+            outcome if isinstance(outcome, PunchResult) else PunchResult(
                 success=False,
-                action=PunchAction.SIMULATE,
+                action=action,
                 timestamp=datetime.now(),
-                message="PunchExecutor 未初始化",
+                message=f"模擬操作失敗: {outcome}",
                 is_simulation=True
             )
-        
-        results = []
-        
-        # 測試簽到
-        if page_status.get('sign_in_available'):
-            result = await self.punch_executor.execute_punch_action(PunchAction.SIGN_IN, False, False)
-            results.append(result)
-        
-        # 測試簽退
-        if page_status.get('sign_out_available'):
-            result = await self.punch_executor.execute_punch_action(PunchAction.SIGN_OUT, False, False)
-            results.append(result)
+            for action, outcome in zip(actions, outcomes)
+        ]
         
         if not results:
             return PunchResult(
@@ -270,7 +368,7 @@ class PunchClockService:
         
         # 返回綜合結果
         overall_success = all(result.success for result in results)
-        action_names = [f"{'簽到' if r.action == PunchAction.SIGN_IN else '簽退'}" for r in results]
+        action_names = [r.action.display_name for r in results]
         
         return PunchResult(
             success=overall_success,
@@ -283,39 +381,51 @@ class PunchClockService:
     async def _test_single_action(self, test_result: VisualTestResult, action: PunchAction, 
                                 page_status: dict) -> None:
         """測試單個打卡動作"""
-        action_name = "簽到" if action == PunchAction.SIGN_IN else "簽退"
-        available_key = 'sign_in_available' if action == PunchAction.SIGN_IN else 'sign_out_available'
+        action_name = action.display_name
+        available_key = _AVAILABLE_KEY[action]
         
         if not page_status.get(available_key, False):
             await self._add_test_step(test_result, f"skip_{action.value}", f"跳過{action_name}（按鈕不可用）", True)
             return
         
         await self._wait_for_user_input(f"準備模擬{action_name}操作")
-        if not self.punch_executor:
-            await self._add_test_step(test_result, f"error_{action.value}", f"{action_name}執行器未初始化", False, "PunchExecutor 未初始化")
-            return
-        result = await self.punch_executor.execute_punch_action(action, False, False)
-        await self._add_test_step(test_result, f"test_{action.value}", f"模擬{action_name}操作", result.success,
-                          None if result.success else result.message)
+        result = await self._require_handlers().punch_executor.execute_punch_action(action, False, False)
+        await self._add_action_step(test_result, result)
+    
+    async def _add_action_step(self, test_result: VisualTestResult, result: PunchResult) -> None:
+        """記錄單個模擬動作的測試步驟（含截圖）"""
+        action = result.action
+        await self._add_test_step(test_result, f"test_{action.value}", f"模擬{action.display_name}操作", result.success,
+                          None if result.success else result.message, result.timestamp)
     
     async def _test_available_actions(self, test_result: VisualTestResult, page_status: dict) -> None:
         """測試所有可用的打卡動作"""
-        if page_status.get('sign_in_available'):
-            await self._test_single_action(test_result, PunchAction.SIGN_IN, page_status)
+        actions = [action for action, available_key in _AVAILABLE_KEY.items() if page_status.get(available_key)]
+        if self.interactive_mode:
+            # 互動模式需逐一提示使用者，依序執行
+            for action in actions:
+                await self._test_single_action(test_result, action, page_status)
+            return
         
-        if page_status.get('sign_out_available'):
-            await self._test_single_action(test_result, PunchAction.SIGN_OUT, page_status)
+        # 模擬只讀取按鈕狀態，不會改變頁面，簽到與簽退可在同一頁面同時進行；
+        # 測試步驟與截圖則在全部完成後依動作順序記錄，報告順序固定
+        punch_executor = self._require_handlers().punch_executor
+        results = await asyncio.gather(
+            *(punch_executor.execute_punch_action(action, False, False) for action in actions)
+        )
+        for result in results:
+            await self._add_action_step(test_result, result)
     
     async def _wait_for_user_input(self, prompt: str) -> None:
         """在互動模式下等待用戶輸入"""
         if not self.interactive_mode:
             return
             
-        print(f"\n🔍 {prompt}")
-        print("   按 Enter 繼續，或輸入 'q' 退出...")
+        print(f"\n🔍 {prompt}\n   按 Enter 繼續，或輸入 'q' 退出...")
         
         try:
-            user_input = input().strip().lower()
+            # 於背景執行緒讀取輸入，等待期間事件迴圈仍可處理其他工作
+            user_input = (await asyncio.to_thread(input)).strip().lower()
             if user_input == 'q':
                 logger.info("使用者選擇退出測試")
                 raise KeyboardInterrupt("使用者中斷測試")
@@ -324,8 +434,12 @@ class PunchClockService:
             raise
     
     async def _add_test_step(self, test_result: VisualTestResult, step_name: str, description: str, 
-                      success: bool, error_message: Optional[str] = None) -> None:
-        """添加測試步驟記錄並自動截圖"""
+                      success: bool, error_message: Optional[str] = None,
+                      timestamp: Optional[datetime] = None) -> None:
+        """添加測試步驟記錄並自動截圖
+        
+        timestamp 未提供時使用目前時間；已有結果時間的步驟可直接沿用
+        """
         # 自動截圖（如果啟用）
         screenshot_path = None
         if self.screenshot_manager and self.screenshot_manager.is_enabled():
@@ -335,42 +449,49 @@ class PunchClockService:
             step_name=step_name,
             description=description,
             success=success,
-            timestamp=datetime.now(),
+            timestamp=timestamp or datetime.now(),
             screenshot_path=screenshot_path,
             error_message=error_message
         )
-        test_result.steps.append(step)
+        test_result.add_step(step)
         
+        # 每個步驟只輸出一筆日誌，有錯誤時整筆以 ERROR 等級記錄；內容交由 loguru 延後格式化
         status = "✅" if success else "❌"
-        logger.info(f"{status} {description}")
+        message = "{} {}"
+        args: List[object] = [status, description]
         if error_message:
-            logger.error(f"   錯誤: {error_message}")
+            message += "\n   錯誤: {}"
+            args.append(error_message)
         if screenshot_path:
-            logger.info(f"   截圖: {screenshot_path}")
+            message += "\n   截圖: {}"
+            args.append(screenshot_path)
+        logger.log("ERROR" if error_message else "INFO", message, *args)
     
     def _finalize_test_result(self, test_result: VisualTestResult) -> VisualTestResult:
         """完成測試結果記錄"""
-        test_result.end_time = datetime.now()
-        test_result.overall_success = all(step.success for step in test_result.steps)
+        now = datetime.now()
+        test_result.mark_finished(now)
+        test_result.overall_success = test_result.all_steps_succeeded
         
         # 更新截圖列表
         if self.screenshot_manager:
             screenshots = self.screenshot_manager.get_screenshots_taken()
+            # 避免重複添加已經關聯到步驟的截圖
+            existing_paths = {s.path for s in test_result.screenshots}
             for screenshot_path in screenshots:
-                # 避免重複添加已經關聯到步驟的截圖
-                existing_paths = {s.path for s in test_result.screenshots}
                 if screenshot_path not in existing_paths:
+                    existing_paths.add(screenshot_path)
                     screenshot_info = ScreenshotInfo(
                         path=screenshot_path,
                         step_name="auto_screenshot",
                         description=f"自動截圖: {screenshot_path.name}",
-                        timestamp=datetime.now()
+                        timestamp=now
                     )
                     test_result.screenshots.append(screenshot_info)
         
         return test_result
     
-    def save_json_report(self, test_result: VisualTestResult, output_path: Path) -> bool:
+    async def save_json_report(self, test_result: VisualTestResult, output_path: Path) -> bool:
         """將測試結果保存為JSON格式"""
         try:
             # 準備可序列化的資料
@@ -403,8 +524,12 @@ class PunchClockService:
                 ]
             }
             
-            with open(output_path, 'w', encoding='utf-8') as f:
-                json.dump(result_data, f, indent=2, ensure_ascii=False)
+            def write_report() -> None:
+                with open(output_path, 'wb') as f:
+                    f.write(_dump_report_json(result_data))
+            
+            # 序列化與寫檔交由背景執行緒，避免阻塞事件迴圈
+            await asyncio.to_thread(write_report)
             
             logger.info(f"JSON測試報告已保存至: {output_path}")
             return True
@@ -415,153 +540,181 @@ class PunchClockService:
     
     def _image_to_base64(self, image_path: Path) -> str:
         """將圖片轉換為base64編碼"""
+        import base64
+        import mmap
+        
         try:
             with open(image_path, 'rb') as f:
-                image_data = f.read()
-            return base64.b64encode(image_data).decode('utf-8')
+                # 空檔案無法 mmap
+                if os.fstat(f.fileno()).st_size == 0:
+                    return ""
+                # 直接對映檔案內容編碼，避免先複製一份 bytes
+                with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+                    return base64.b64encode(mm).decode('ascii')
         except Exception as e:
             logger.error(f"圖片轉換失敗 {image_path}: {e}")
             return ""
     
-    def generate_html_report(self, test_result: VisualTestResult, output_path: Path) -> bool:
-        """生成HTML測試報告"""
+    @staticmethod
+    def _existing_files(paths: Iterable[Path]) -> List[Path]:
+        """篩選存在的檔案；同一目錄只列舉一次，不對每個檔案各做一次 stat"""
+        names_by_dir: Dict[Path, set] = {}
+        existing = []
+        for path in paths:
+            names = names_by_dir.get(path.parent)
+            if names is None:
+                try:
+                    with os.scandir(path.parent) as entries:
+                        names = {entry.name for entry in entries if entry.is_file()}
+                except OSError:
+                    names = set()
+                names_by_dir[path.parent] = names
+            if path.name in names:
+                existing.append(path)
+        return existing
+    
+    @staticmethod
+    def _image_mime_type(image_path: Path) -> str:
+        """依副檔名取得圖片 MIME 類型"""
+        return "image/jpeg" if image_path.suffix.lower() in (".jpg", ".jpeg") else "image/png"
+    
+    @staticmethod
+    def _image_link(image_path: Path, output_path: Path) -> str:
+        """取得報告引用截圖用的路徑（優先使用相對於報告的路徑）"""
         try:
-            # 使用更簡單的HTML模板，避免格式化衝突
-            html_parts = [
-                '<!DOCTYPE html>',
-                '<html lang="zh-TW">',
-                '<head>',
-                '    <meta charset="UTF-8">',
-                '    <meta name="viewport" content="width=device-width, initial-scale=1.0">',
-                '    <title>震旦HR自動打卡 - 視覺化測試報告</title>',
-                '    <style>',
-                '        body { font-family: sans-serif; margin: 20px; background: #f5f5f5; }',
-                '        .container { max-width: 1200px; margin: 0 auto; background: white; padding: 30px; border-radius: 10px; }',
-                '        .header { text-align: center; margin-bottom: 30px; padding-bottom: 20px; border-bottom: 2px solid #eee; }',
-                '        .summary { display: grid; grid-template-columns: repeat(auto-fit, minmax(200px, 1fr)); gap: 20px; margin-bottom: 30px; }',
-                '        .summary-card { background: #f8f9fa; padding: 20px; border-radius: 8px; text-align: center; }',
-                '        .summary-card.success { border-left: 4px solid #28a745; }',
-                '        .summary-card.error { border-left: 4px solid #dc3545; }',
-                '        .summary-card .value { font-size: 2em; font-weight: bold; color: #2c3e50; }',
-                '        .step { border: 1px solid #dee2e6; border-radius: 8px; margin-bottom: 15px; }',
-                '        .step-header { padding: 15px 20px; background: #f8f9fa; cursor: pointer; }',
-                '        .step-header.success { border-left: 4px solid #28a745; }',
-                '        .step-header.error { border-left: 4px solid #dc3545; }',
-                '        .step-content { padding: 20px; display: none; }',
-                '        .step-content.show { display: block; }',
-                '        .screenshot { max-width: 100%; border: 1px solid #dee2e6; border-radius: 4px; margin: 10px 0; }',
-                '        .status-badge { padding: 4px 12px; border-radius: 4px; color: white; font-size: 0.9em; font-weight: bold; }',
-                '        .status-success { background-color: #28a745; }',
-                '        .status-error { background-color: #dc3545; }',
-                '        .screenshots-grid { display: grid; grid-template-columns: repeat(auto-fill, minmax(300px, 1fr)); gap: 20px; margin-top: 30px; }',
-                '        .screenshot-card { border: 1px solid #dee2e6; border-radius: 8px; overflow: hidden; }',
-                '        .screenshot-card img { width: 100%; height: auto; }',
-                '        .screenshot-info { padding: 15px; background: #f8f9fa; }',
-                '    </style>',
-                '    <script>',
-                '        function toggleStep(element) {',
-                '            const content = element.nextElementSibling;',
-                '            content.classList.toggle("show");',
-                '        }',
-                '    </script>',
-                '</head>',
-                '<body>',
-                '    <div class="container">',
-                '        <div class="header">',
-                '            <h1>🤖 震旦HR自動打卡 - 視覺化測試報告</h1>',
-                '            <p>測試時間: ' + test_result.start_time.strftime('%Y-%m-%d %H:%M:%S') + ' - ' + (test_result.end_time.strftime('%Y-%m-%d %H:%M:%S') if test_result.end_time else '進行中') + '</p>',
-                '        </div>',
-                '        <div class="summary">',
-                '            <div class="summary-card ' + ('success' if test_result.overall_success else 'error') + '">',
-                '                <h3>整體結果</h3>',
-                '                <div class="value">' + ('✅ 成功' if test_result.overall_success else '❌ 失敗') + '</div>',
-                '            </div>',
-                '            <div class="summary-card">',
-                '                <h3>執行時間</h3>',
-                '                <div class="value">' + ('{:.2f}秒'.format(test_result.duration) if test_result.duration else 'N/A') + '</div>',
-                '            </div>',
-                '            <div class="summary-card ' + ('success' if test_result.success_rate >= 0.8 else 'error') + '">',
-                '                <h3>成功率</h3>',
-                '                <div class="value">' + '{:.1%}'.format(test_result.success_rate) + '</div>',
-                '            </div>',
-                '            <div class="summary-card">',
-                '                <h3>截圖數量</h3>',
-                '                <div class="value">' + str(len(test_result.screenshots)) + '</div>',
-                '            </div>',
-                '        </div>',
-                '        <div class="steps">',
-                '            <h2>📋 測試步驟詳情</h2>'
-            ]
+            return Path(os.path.relpath(image_path, output_path.parent)).as_posix()
+        except ValueError:
+            # 例如 Windows 上位於不同磁碟機
+            return image_path.resolve().as_uri()
+    
+    async def generate_html_report(self, test_result: VisualTestResult, output_path: Path,
+                                   standalone: bool = False) -> bool:
+        """生成HTML測試報告
+        
+        Args:
+            test_result: 視覺化測試結果
+            output_path: 報告輸出路徑
+            standalone: 是否以 base64 內嵌截圖（單一檔案便於分享）；預設以相對路徑連結截圖檔案
+        """
+        try:
+            # 同一張截圖會同時出現在步驟與截圖預覽，先收集不重複的路徑，檢查與編碼只做一次
+            candidate_paths = list(dict.fromkeys(
+                [step.screenshot_path for step in test_result.steps if step.screenshot_path]
+                + [screenshot.path for screenshot in test_result.screenshots]
+            ))
+            image_sources: Dict[Path, str] = {}
             
-            # 生成步驟HTML
-            for i, step in enumerate(test_result.steps, 1):
-                status_class = "success" if step.success else "error"
-                status_text = "成功" if step.success else "失敗"
-                status_badge_class = "status-success" if step.success else "status-error"
-                
-                screenshot_html = ""
-                if step.screenshot_path and step.screenshot_path.exists():
-                    img_base64 = self._image_to_base64(step.screenshot_path)
-                    if img_base64:
-                        screenshot_html = '<img src="data:image/png;base64,' + img_base64 + '" class="screenshot" alt="步驟截圖">'
-                
-                error_html = ""
-                if step.error_message:
-                    error_html = '<p><strong>錯誤訊息:</strong> ' + step.error_message + '</p>'
-                
-                html_parts.extend([
-                    '            <div class="step">',
-                    '                <div class="step-header ' + status_class + '" onclick="toggleStep(this)">',
-                    '                    <div>',
-                    '                        <strong>' + str(i) + '. ' + step.description + '</strong>',
-                    '                        <small style="color: #6c757d; margin-left: 10px;">' + step.timestamp.strftime('%H:%M:%S') + '</small>',
-                    '                    </div>',
-                    '                    <span class="status-badge ' + status_badge_class + '">' + status_text + '</span>',
-                    '                </div>',
-                    '                <div class="step-content">',
-                    '                    <p><strong>步驟名稱:</strong> ' + step.step_name + '</p>',
-                    '                    ' + error_html,
-                    '                    ' + screenshot_html,
-                    '                </div>',
-                    '            </div>'
-                ])
+            def collect_image_sources() -> None:
+                image_paths = self._existing_files(candidate_paths)
+                if standalone:
+                    # 各截圖編碼互不相依，以執行緒池並行處理；限制同時讀取的檔案數
+                    with ThreadPoolExecutor(max_workers=_MAX_IMAGE_READS) as executor:
+                        encoded = list(executor.map(self._image_to_base64, image_paths))
+                    for path, img_base64 in zip(image_paths, encoded):
+                        if img_base64:
+                            image_sources[path] = 'data:' + self._image_mime_type(path) + ';base64,' + img_base64
+                else:
+                    for path in image_paths:
+                        image_sources[path] = self._image_link(path, output_path)
             
-            html_parts.extend([
-                '        </div>',
-                '        <div class="screenshots-section">',
-                '            <h2>📸 截圖預覽</h2>',
-                '            <div class="screenshots-grid">'
-            ])
+            def image_src(image_path: Path) -> str:
+                return image_sources.get(image_path, "")
             
-            # 生成截圖HTML
-            for screenshot in test_result.screenshots:
-                if screenshot.path.exists():
-                    img_base64 = self._image_to_base64(screenshot.path)
-                    if img_base64:
-                        html_parts.extend([
-                            '                <div class="screenshot-card">',
-                            '                    <img src="data:image/png;base64,' + img_base64 + '" alt="' + screenshot.description + '">',
-                            '                    <div class="screenshot-info">',
-                            '                        <strong>' + screenshot.description + '</strong><br>',
-                            '                        <small>' + screenshot.timestamp.strftime('%H:%M:%S') + '</small>',
-                            '                    </div>',
-                            '                </div>'
-                        ])
+            # 步驟與截圖常共用同一時間戳記，格式化結果快取重用
+            time_labels: Dict[datetime, str] = {}
             
-            html_parts.extend([
-                '            </div>',
-                '        </div>',
-                '    </div>',
-                '</body>',
-                '</html>'
-            ])
+            def time_label(timestamp: datetime) -> str:
+                label = time_labels.get(timestamp)
+                if label is None:
+                    label = time_labels[timestamp] = timestamp.strftime('%H:%M:%S')
+                return label
             
-            # 組合HTML內容
-            html_content = '\n'.join(html_parts)
+            # 直接逐段寫入檔案，不在記憶體中組合整份HTML；檢查截圖與寫檔都交由背景執行緒，避免阻塞事件迴圈
+            def write_report() -> None:
+                collect_image_sources()
+                with open(output_path, 'w', encoding='utf-8', buffering=1 << 20) as f:
+                    w = f.write
+                    def write_lines(lines: List[str]) -> None:
+                        f.writelines(line + '\n' for line in lines)
+                    
+                    w(_HTML_HEAD)
+                    write_lines([
+                        '        <div class="header">',
+                        '            <h1>🤖 震旦HR自動打卡 - 視覺化測試報告</h1>',
+                        '            <p>測試時間: ' + test_result.start_time.strftime('%Y-%m-%d %H:%M:%S') + ' - ' + (test_result.end_time.strftime('%Y-%m-%d %H:%M:%S') if test_result.end_time else '進行中') + '</p>',
+                        '        </div>',
+                        '        <div class="summary">',
+                        '            <div class="summary-card ' + ('success' if test_result.overall_success else 'error') + '">',
+                        '                <h3>整體結果</h3>',
+                        '                <div class="value">' + ('✅ 成功' if test_result.overall_success else '❌ 失敗') + '</div>',
+                        '            </div>',
+                        '            <div class="summary-card">',
+                        '                <h3>執行時間</h3>',
+                        '                <div class="value">' + ('{:.2f}秒'.format(test_result.duration) if test_result.duration else 'N/A') + '</div>',
+                        '            </div>',
+                        '            <div class="summary-card ' + ('success' if test_result.success_rate >= 0.8 else 'error') + '">',
+                        '                <h3>成功率</h3>',
+                        '                <div class="value">' + '{:.1%}'.format(test_result.success_rate) + '</div>',
+                        '            </div>',
+                        '            <div class="summary-card">',
+                        '                <h3>截圖數量</h3>',
+                        '                <div class="value">' + str(len(test_result.screenshots)) + '</div>',
+                        '            </div>',
+                        '        </div>',
+                        '        <div class="steps">',
+                        '            <h2>📋 測試步驟詳情</h2>'
+                    ])
+                    
+                    # 生成步驟HTML
+                    for i, step in enumerate(test_result.steps, 1):
+                        status_class = "success" if step.success else "error"
+                        status_text = "成功" if step.success else "失敗"
+                        status_badge_class = "status-success" if step.success else "status-error"
+                        
+                        screenshot_html = ""
+                        if step.screenshot_path:
+                            src = image_src(step.screenshot_path)
+                            if src:
+                                screenshot_html = f'<img src="{escape(src)}" class="screenshot" alt="步驟截圖">'
+                        
+                        error_html = ""
+                        if step.error_message:
+                            error_html = f'<p><strong>錯誤訊息:</strong> {escape(step.error_message)}</p>'
+                        
+                        w(_STEP_TEMPLATE.format(
+                            index=i,
+                            status_class=status_class,
+                            status_badge_class=status_badge_class,
+                            status_text=status_text,
+                            description=escape(step.description),
+                            time=time_label(step.timestamp),
+                            step_name=escape(step.step_name),
+                            error_html=error_html,
+                            screenshot_html=screenshot_html
+                        ))
+                    
+                    write_lines([
+                        '        </div>',
+                        '        <div class="screenshots-section">',
+                        '            <h2>📸 截圖預覽</h2>',
+                        '            <div class="screenshots-grid">'
+                    ])
+                    
+                    # 生成截圖HTML（同一截圖檔只顯示一次）
+                    shown_paths = set()
+                    for screenshot in test_result.screenshots:
+                        src = image_src(screenshot.path)
+                        if src and screenshot.path not in shown_paths:
+                            shown_paths.add(screenshot.path)
+                            w(_SCREENSHOT_TEMPLATE.format(
+                                src=escape(src),
+                                description=escape(screenshot.description),
+                                time=time_label(screenshot.timestamp)
+                            ))
+                    
+                    w(_HTML_FOOT)
             
-            # 寫入檔案
-            with open(output_path, 'w', encoding='utf-8') as f:
-                f.write(html_content)
+            await asyncio.to_thread(write_report)
             
             logger.info(f"HTML測試報告已生成: {output_path}")
             return True
@@ -581,11 +734,25 @@ class PunchClockService:
             is_simulation=True
         )
     
+    def _require_handlers(self) -> _Handlers:
+        """取得 __aenter__ 建立的處理器，尚未初始化時拋出錯誤"""
+        if (self.auth_handler is None or self.navigation_handler is None
+                or self.status_checker is None or self.punch_executor is None):
+            raise PunchClockError("打卡服務處理器未初始化，請在 async with 區塊內執行")
+        return _Handlers(self.auth_handler, self.navigation_handler, self.status_checker, self.punch_executor)
+    
     async def __aenter__(self):
         """異步上下文管理器進入"""
         # 初始化瀏覽器管理器
-        self.browser_manager = BrowserManager(self.headless, self.gps_config)
-        page = await self.browser_manager.initialize()
+        self.browser_manager = BrowserManager(
+            self.headless, self.gps_config, self.reuse_browser,
+            block_visual_assets=not self.enable_screenshots
+        )
+        if self.reuse_browser:
+            # 從行程共用的瀏覽器借用 context，省去每次啟動 Chromium
+            page = await self.browser_manager.acquire_context()
+        else:
+            page = await self.browser_manager.initialize()
         
         # 初始化截圖管理器
         self.screenshot_manager = ScreenshotManager(page, self.enable_screenshots, self.screenshots_dir)
@@ -600,8 +767,7 @@ class PunchClockService:
         await self.browser_manager.navigate_to_base_url()
         
         # 初始截圖
-        if self.screenshot_manager:
-            await self.screenshot_manager.take_screenshot("page_loaded", "登入頁面載入完成")
+        await self.screenshot_manager.take_screenshot("page_loaded", "登入頁面載入完成")
         
         logger.info("打卡服務初始化完成")
         return self
@@ -617,7 +783,7 @@ class PunchClockService:
         
         try:
             # 準備動作名稱
-            action_name = "簽到" if punch_result.action == PunchAction.SIGN_IN else "簽退"
+            action_name = punch_result.action.display_name
             
             # 準備詳細資訊
             details = {
@@ -633,10 +799,14 @@ class PunchClockService:
             # 準備截圖列表
             screenshots = []
             if self.enable_screenshots:
+                # 確保背景寫入的截圖已落地
+                if self.screenshot_manager:
+                    await self.screenshot_manager.flush()
+                
                 # 收集最新的截圖檔案
                 screenshots_dir = Path(self.screenshots_dir)
                 if screenshots_dir.exists():
-                    recent_screenshots = list(screenshots_dir.glob("*.png"))
+                    recent_screenshots = [*screenshots_dir.glob("*.jpg"), *screenshots_dir.glob("*.png")]
                     # 按修改時間排序，取最新的幾張
                     recent_screenshots.sort(key=lambda x: x.stat().st_mtime, reverse=True)
                     screenshots = [str(f) for f in recent_screenshots[:3]]  # 最多3張截圖
@@ -727,6 +897,13 @@ class PunchClockService:
     async def __aexit__(self, exc_type, exc_val, exc_tb):
         """異步上下文管理器退出"""
         _ = exc_type, exc_val, exc_tb  # 忽略未使用的參數
+        if self.screenshot_manager:
+            await self.screenshot_manager.flush()
         if self.browser_manager:
-            await self.browser_manager.cleanup()
+            if self.reuse_browser:
+                await self.browser_manager.release_context()
+            else:
+                await self.browser_manager.cleanup()
+        if self.webhook_manager:
+            await self.webhook_manager.close()
         logger.info("打卡服務已清理")
\ No newline at end of file
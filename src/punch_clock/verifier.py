@@ -4,11 +4,38 @@
 """
 
 import asyncio
-from typing import Optional
+import re
+from typing import List, Optional
 from playwright.async_api import Page
+from playwright.async_api import TimeoutError as PlaywrightTimeoutError
 from loguru import logger
 
 from src.models import PunchAction
+from .checker import StatusChecker
+
+
+# 打卡成功與失敗指示器：完全相符的文字，以及 CSS 選擇器（tuple 於模組載入時建立一次）
+SUCCESS_TEXTS = ("打卡成功", "簽到成功", "簽退成功")
+SUCCESS_SELECTORS = ('.success-message', 'ion-toast[color="success"]', '.alert-success')
+ERROR_TEXTS = ("打卡失敗", "簽到失敗", "簽退失敗")
+ERROR_SELECTORS = ('.error-message', 'ion-toast[color="danger"]', '.alert-danger')
+
+# 可見的成功、失敗指示器（Playwright 選擇器會穿透 shadow DOM）
+SUCCESS_INDICATOR_SELECTOR = ', '.join(
+    f'{selector}:visible' for selector in [f':text-is("{text}")' for text in SUCCESS_TEXTS] + list(SUCCESS_SELECTORS)
+)
+ERROR_INDICATOR_SELECTOR = ', '.join(
+    f'{selector}:visible' for selector in [f':text-is("{text}")' for text in ERROR_TEXTS] + list(ERROR_SELECTORS)
+)
+
+# 任何形式的可見頁面回應（提示訊息、成功/錯誤訊息、通知）
+RESPONSE_SELECTOR = ', '.join(
+    f'{selector}:visible'
+    for selector in ('ion-toast', '.success-message', '.error-message', '.alert', '.notification')
+)
+
+# 至少含一個非空白字元
+NON_BLANK_TEXT = re.compile(r'\S')
 
 
 class ResultVerifier:
@@ -17,127 +44,107 @@ class ResultVerifier:
     def __init__(self, page: Page):
         self.page = page
     
-    async def verify_punch_result(self, action: PunchAction, timeout: int = 10000) -> dict:
-        """驗證打卡操作結果"""
+    async def verify_punch_result(self, action: PunchAction, timeout: int = 10000,
+                                  pre_state: Optional[dict] = None) -> dict:
+        """驗證打卡操作結果
+        
+        Args:
+            pre_state: 點擊前的頁面狀態；提供時按鈕狀態判斷只重新讀取按鈕，不再做完整頁面檢查
+        """
         try:
-            action_name = "簽到" if action == PunchAction.SIGN_IN else "簽退"
-            logger.info(f"🔍 驗證 {action_name} 操作結果...")
-            
-            # 成功和失敗指示器
-            success_indicators = [
-                'text="打卡成功"',
-                'text="簽到成功"',
-                'text="簽退成功"',
-                '.success-message',
-                'ion-toast[color="success"]',
-                '.alert-success'
-            ]
-            
-            error_indicators = [
-                'text="打卡失敗"',
-                'text="簽到失敗"',
-                'text="簽退失敗"',
-                '.error-message',
-                'ion-toast[color="danger"]',
-                '.alert-danger'
-            ]
-            
+            action_name = action.display_name
+            logger.info("🔍 驗證 {} 操作結果...", action_name)
             
-            # 等待成功或失敗指示器出現
-            wait_time = timeout / 1000
-            check_interval = 0.5
-            elapsed_time = 0.0
+            success = self.page.locator(SUCCESS_INDICATOR_SELECTOR)
+            error = self.page.locator(ERROR_INDICATOR_SELECTOR)
+            # 只等待與本次動作相關的提示訊息，無關的提示不會提前結束等待
+            toasts = self.page.locator('ion-toast:visible').filter(has_text=re.compile(f"{action_name}|打卡"))
             
-            while elapsed_time < wait_time:
-                # 檢查成功指示器
-                for indicator in success_indicators:
-                    result = await self._check_indicator(indicator, True, action_name)
-                    if result:
-                        return result
-                
-                # 檢查失敗指示器
-                for indicator in error_indicators:
-                    result = await self._check_indicator(indicator, False, action_name)
-                    if result:
-                        return result
-                
-                # 檢查一般提示訊息
-                result = await self._check_toast_messages(action_name)
+            # 由 Playwright 以選擇器查詢等待任一結果出現，不需每次變動都掃描整個 DOM
+            try:
+                await success.or_(error).or_(toasts).first.wait_for(state='visible', timeout=timeout)
+            except PlaywrightTimeoutError:
+                pass
+            else:
+                success_texts, error_texts, toast_texts = await asyncio.gather(
+                    success.all_text_contents(), error.all_text_contents(), toasts.all_text_contents()
+                )
+                # 依成功、失敗、一般提示訊息的優先順序判斷
+                if success_texts:
+                    return self._indicator_result(True, success_texts[0], action_name)
+                if error_texts:
+                    return self._indicator_result(False, error_texts[0], action_name)
+                result = self._toast_result(toast_texts, action_name)
                 if result:
                     return result
-                
-                await asyncio.sleep(check_interval)
-                elapsed_time += check_interval
             
             # 如果沒有明確指示器，嘗試通過按鈕狀態判斷
             logger.info("🔄 未檢測到明確結果指示器，嘗試通過按鈕狀態判斷...")
-            return await self._verify_by_button_state(action, action_name)
+            return await self._verify_by_button_state(action, action_name, pre_state)
             
         except Exception as e:
-            logger.error(f"驗證 {action.value} 結果時發生錯誤: {e}")
+            logger.error("驗證 {} 結果時發生錯誤: {}", action.value, e)
             return {
                 "success": False,
                 "message": f"驗證結果時發生錯誤: {str(e)}",
                 "server_response": None
             }
     
-    async def _check_indicator(self, selector: str, is_success: bool, action_name: str) -> Optional[dict]:
-        """檢查特定指示器"""
-        try:
-            element = await self.page.query_selector(selector)
-            if element and await element.is_visible():
-                text_content = await element.text_content()
-                status = "✅" if is_success else "❌"
-                logger.info(f"{status} 檢測到{'成功' if is_success else '失敗'}指示器: {text_content}")
-                
-                return {
-                    "success": is_success,
-                    "message": f"{action_name} {'成功' if is_success else '失敗'}",
-                    "server_response": text_content
-                }
-        except Exception:
-            pass
-        return None
+    def _indicator_result(self, is_success: bool, text_content: str, action_name: str) -> dict:
+        """依偵測到的指示器建立結果"""
+        status = "✅" if is_success else "❌"
+        logger.info("{} 檢測到{}指示器: {}", status, '成功' if is_success else '失敗', text_content)
+        
+        return {
+            "success": is_success,
+            "message": f"{action_name} {'成功' if is_success else '失敗'}",
+            "server_response": text_content
+        }
     
-    async def _check_toast_messages(self, action_name: str) -> Optional[dict]:
-        """檢查提示訊息"""
-        try:
-            toast_elements = await self.page.query_selector_all('ion-toast')
-            for toast in toast_elements:
-                if await toast.is_visible():
-                    toast_text = await toast.text_content()
-                    if toast_text and (action_name in toast_text or "打卡" in toast_text):
-                        logger.info(f"📄 檢測到提示訊息: {toast_text}")
-                        
-                        # 根據訊息內容判斷成功或失敗
-                        if "成功" in toast_text:
-                            return {
-                                "success": True,
-                                "message": f"{action_name} 成功",
-                                "server_response": toast_text
-                            }
-                        elif "失敗" in toast_text or "錯誤" in toast_text:
-                            return {
-                                "success": False,
-                                "message": f"{action_name} 失敗",
-                                "server_response": toast_text
-                            }
-                        else:
-                            return {
-                                "success": None,  # 未知狀態
-                                "message": f"{action_name} 結果: {toast_text}",
-                                "server_response": toast_text
-                            }
-        except Exception:
-            pass
+    def _toast_result(self, toast_texts: List[str], action_name: str) -> Optional[dict]:
+        """從可見的提示訊息判斷結果"""
+        for toast_text in toast_texts:
+            if toast_text and (action_name in toast_text or "打卡" in toast_text):
+                logger.info("📄 檢測到提示訊息: {}", toast_text)
+                
+                # 根據訊息內容判斷成功或失敗
+                if "成功" in toast_text:
+                    return {
+                        "success": True,
+                        "message": f"{action_name} 成功",
+                        "server_response": toast_text
+                    }
+                elif "失敗" in toast_text or "錯誤" in toast_text:
+                    return {
+                        "success": False,
+                        "message": f"{action_name} 失敗",
+                        "server_response": toast_text
+                    }
+                else:
+                    return {
+                        "success": None,  # 未知狀態
+                        "message": f"{action_name} 結果: {toast_text}",
+                        "server_response": toast_text
+                    }
         return None
     
-    async def _verify_by_button_state(self, action: PunchAction, action_name: str) -> dict:
+    async def _verify_by_button_state(self, action: PunchAction, action_name: str,
+                                      pre_state: Optional[dict] = None) -> dict:
         """通過按鈕狀態變化判斷結果"""
         try:
-            from .checker import StatusChecker
             checker = StatusChecker(self.page)
-            current_status = await checker.check_punch_page_status()
+            if pre_state is not None:
+                # 頁面已確認載入，只需重新讀取兩個按鈕的狀態
+                sign_in_available, sign_out_available = await asyncio.gather(
+                    checker.check_button_availability("sign_in"),
+                    checker.check_button_availability("sign_out")
+                )
+                current_status = {
+                    "sign_in_available": sign_in_available,
+                    "sign_out_available": sign_out_available
+                }
+            else:
+                current_status = await checker.check_punch_page_status()
             
             if action == PunchAction.SIGN_IN:
                 # 簽到後，簽到按鈕應該變為不可用，簽退按鈕變為可用
@@ -171,9 +178,9 @@ class ResultVerifier:
                     }
                     
         except Exception as status_error:
-            logger.warning(f"無法檢查按鈕狀態: {status_error}")
+            logger.warning("無法檢查按鈕狀態: {}", status_error)
         
-        logger.warning(f"⚠️ {action_name} 結果驗證超時或未明確")
+        logger.warning("⚠️ {} 結果驗證超時或未明確", action_name)
         return {
             "success": False,
             "message": f"{action_name} 結果驗證超時",
@@ -183,37 +190,19 @@ class ResultVerifier:
     async def wait_for_page_response(self, timeout: int = 5000) -> Optional[str]:
         """等待頁面回應（任何形式的提示訊息）"""
         try:
-            wait_time = timeout / 1000
-            check_interval = 0.5
-            elapsed_time = 0.0
-            
-            while elapsed_time < wait_time:
-                # 檢查各種可能的回應元素
-                response_selectors = [
-                    'ion-toast',
-                    '.success-message',
-                    '.error-message',
-                    '.alert',
-                    '.notification'
-                ]
-                
-                for selector in response_selectors:
-                    try:
-                        elements = await self.page.query_selector_all(selector)
-                        for element in elements:
-                            if element and await element.is_visible():
-                                text = await element.text_content()
-                                if text and text.strip():
-                                    logger.info(f"檢測到頁面回應: {text.strip()}")
-                                    return text.strip()
-                    except Exception:
-                        continue
-                
-                await asyncio.sleep(check_interval)
-                elapsed_time += check_interval
+            # 由頁面端等待第一個可見且有文字的回應元素，不必輪詢
+            response = self.page.locator(RESPONSE_SELECTOR).filter(has_text=NON_BLANK_TEXT).first
+            try:
+                await response.wait_for(state='visible', timeout=timeout)
+                text = await response.text_content(timeout=1000)
+            except PlaywrightTimeoutError:
+                return None
             
+            if text and text.strip():
+                logger.info("檢測到頁面回應: {}", text.strip())
+                return text.strip()
             return None
             
         except Exception as e:
-            logger.error(f"等待頁面回應時發生錯誤: {e}")
+            logger.error("等待頁面回應時發生錯誤: {}", e)
             return None
\ No newline at end of file
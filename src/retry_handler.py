@@ -3,14 +3,23 @@
 """
 
 import asyncio
+import random
+import re
+import time
 from typing import Any, Callable, Optional, Type
 from functools import wraps
-from datetime import datetime
 from loguru import logger
 from playwright.async_api import TimeoutError as PlaywrightTimeoutError
 from playwright.async_api import Error as PlaywrightError
 
 
+# 未知錯誤若訊息含有下列關鍵字，視為暫時性錯誤可重試
+_RETRYABLE_MESSAGE_RE = re.compile(
+    r'timeout|connection|network|disconnected|reset|refused|unreachable|aborted',
+    re.IGNORECASE
+)
+
+
 class RetryConfig:
     """重試配置"""
     
@@ -79,6 +88,10 @@ class RetryHandler:
         TypeError,   # 類型錯誤
     )
     
+    # 精確類型查表，常見情況不必逐一 isinstance 比對
+    _RETRYABLE_TYPES = frozenset(RETRYABLE_ERRORS)
+    _NON_RETRYABLE_TYPES = frozenset(NON_RETRYABLE_ERRORS)
+    
     def __init__(self, config: Optional[RetryConfig] = None):
         self.config = config or RetryConfig()
     
@@ -88,7 +101,6 @@ class RetryHandler:
         delay = min(delay, self.config.max_delay)
         
         if self.config.jitter:
-            import random
             # 添加 ±25% 的隨機抖動
             jitter = random.uniform(-0.25, 0.25) * delay
             delay += jitter
@@ -97,7 +109,13 @@ class RetryHandler:
     
     def is_retryable_error(self, error: Exception) -> bool:
         """判斷錯誤是否可重試"""
-        # 檢查不可重試的錯誤
+        error_type = type(error)
+        if error_type in self._NON_RETRYABLE_TYPES:
+            return False
+        if error_type in self._RETRYABLE_TYPES:
+            return True
+        
+        # 子類別仍以 isinstance 判斷，檢查不可重試的錯誤
         if isinstance(error, self.NON_RETRYABLE_ERRORS):
             return False
         
@@ -106,13 +124,7 @@ class RetryHandler:
             return True
         
         # 對於未知錯誤，檢查錯誤訊息中的關鍵字
-        error_message = str(error).lower()
-        retryable_keywords = [
-            'timeout', 'connection', 'network', 'disconnected',
-            'reset', 'refused', 'unreachable', 'aborted'
-        ]
-        
-        return any(keyword in error_message for keyword in retryable_keywords)
+        return _RETRYABLE_MESSAGE_RE.search(str(error)) is not None
     
     async def retry_async(
         self,
@@ -172,20 +184,21 @@ def retry_on_error(
 ):
     """重試裝飾器"""
     
+    # 設定在裝飾時即已固定，只需建立一次處理器
+    handler = RetryHandler(RetryConfig(
+        max_attempts=max_attempts,
+        base_delay=base_delay,
+        max_delay=max_delay,
+        exponential_base=exponential_base,
+        jitter=jitter
+    ))
+    
     def decorator(func: Callable):
+        context = error_context or func.__name__
+        
         @wraps(func)
         async def wrapper(*args, **kwargs):
-            config = RetryConfig(
-                max_attempts=max_attempts,
-                base_delay=base_delay,
-                max_delay=max_delay,
-                exponential_base=exponential_base,
-                jitter=jitter
-            )
-            handler = RetryHandler(config)
-            return await handler.retry_async(
-                func, *args, error_context=error_context or func.__name__, **kwargs
-            )
+            return await handler.retry_async(func, *args, error_context=context, **kwargs)
         return wrapper
     return decorator
 
@@ -204,8 +217,9 @@ class CircuitBreaker:
         self.expected_exception = expected_exception
         
         self.failure_count = 0
-        self.last_failure_time: Optional[datetime] = None
+        self.last_failure_time: Optional[float] = None  # time.monotonic() 時間點
         self.state = 'CLOSED'  # CLOSED, OPEN, HALF_OPEN
+        self._trial_in_flight = False  # 半開狀態下是否已有試探呼叫在執行
     
     def can_execute(self) -> bool:
         """檢查是否可以執行操作"""
@@ -214,35 +228,45 @@ class CircuitBreaker:
         
         if self.state == 'OPEN':
             # 檢查是否可以嘗試恢復
-            if self.last_failure_time and (datetime.now() - self.last_failure_time).seconds >= self.recovery_timeout:
+            if (self.last_failure_time is not None
+                    and time.monotonic() - self.last_failure_time >= self.recovery_timeout):
                 self.state = 'HALF_OPEN'
                 logger.info("熔斷器進入半開狀態，嘗試恢復")
+                self._trial_in_flight = True
                 return True
             return False
         
-        # HALF_OPEN 狀態允許一次嘗試
-        return self.state == 'HALF_OPEN'
+        # HALF_OPEN 狀態只允許一次嘗試，結果回來前其他呼叫一律拒絕
+        if self._trial_in_flight:
+            return False
+        self._trial_in_flight = True
+        return True
     
     def record_success(self):
         """記錄成功"""
+        self._trial_in_flight = False
         self.failure_count = 0
         self.state = 'CLOSED'
-        if self.last_failure_time:
+        if self.last_failure_time is not None:
             logger.success("熔斷器恢復正常狀態")
             self.last_failure_time = None
     
     def record_failure(self, exception: Exception):
         """記錄失敗"""
+        self._trial_in_flight = False
         if isinstance(exception, self.expected_exception):
             self.failure_count += 1
-            self.last_failure_time = datetime.now()
+            self.last_failure_time = time.monotonic()
             
             if self.failure_count >= self.failure_threshold:
                 self.state = 'OPEN'
                 logger.error(f"熔斷器觸發，連續失敗 {self.failure_count} 次")
     
     async def call(self, func: Callable, *args, **kwargs):
-        """執行函數（帶熔斷器保護）"""
+        """執行函數（帶熔斷器保護）
+        
+        狀態檢查與更新之間沒有 await，在同一事件迴圈中不會被其他協程打斷
+        """
         if not self.can_execute():
             raise PunchClockError("熔斷器開啟，暫時無法執行操作")
         
@@ -253,6 +277,10 @@ class CircuitBreaker:
         except Exception as e:
             self.record_failure(e)
             raise
+        except asyncio.CancelledError:
+            # 被取消不算成功或失敗，但要釋放半開狀態的試探名額
+            self._trial_in_flight = False
+            raise
 
 
 # 全域重試處理器實例
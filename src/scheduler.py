@@ -4,8 +4,10 @@
 """
 
 import asyncio
+import time
 from datetime import datetime
-from typing import Optional, Callable, Dict, Any
+from typing import Optional, Callable, Dict, Any, List, Set, Tuple
+from zoneinfo import ZoneInfo
 from loguru import logger
 from apscheduler.schedulers.asyncio import AsyncIOScheduler  # type: ignore
 from apscheduler.triggers.cron import CronTrigger  # type: ignore
@@ -14,7 +16,13 @@ from apscheduler.jobstores.memory import MemoryJobStore  # type: ignore
 from apscheduler.executors.asyncio import AsyncIOExecutor  # type: ignore
 
 from src.models import ScheduleConfig, PunchAction, PunchResult
-from src.config import ConfigManager
+from src.config import ConfigManager, config_manager as default_config_manager
+
+# 排程時區，模組載入時解析一次
+TIMEZONE = ZoneInfo('Asia/Taipei')
+
+# 僅工作日排程使用的星期範圍（週一到週五）
+WEEKDAYS = 'mon-fri'
 
 
 class PunchScheduler:
@@ -25,6 +33,10 @@ class PunchScheduler:
         self.scheduler: Optional[AsyncIOScheduler] = None
         self.is_running = False
         self._punch_callback: Optional[Callable] = None
+        self._punch_job_names: Dict[str, str] = {}  # 打卡任務 ID -> 任務名稱
+        self._inflight_punches: Set[asyncio.Task] = set()  # 執行中的打卡操作
+        self._scheduled_config: Optional[ScheduleConfig] = None  # 已加入排程的設定
+        self._jobs_cache: Optional[Tuple[float, List[Dict[str, Any]]]] = None  # (到期時間, 任務快照)
         
         # 初始化排程器
         self._init_scheduler()
@@ -47,7 +59,7 @@ class PunchScheduler:
             jobstores=jobstores,
             executors=executors,
             job_defaults=job_defaults,
-            timezone='Asia/Taipei'  # 設定時區
+            timezone=TIMEZONE
         )
     
     def set_punch_callback(self, callback: Callable):
@@ -97,8 +109,14 @@ class PunchScheduler:
             return
         
         if self.scheduler:
-            self.scheduler.shutdown()
+            self.scheduler.shutdown(wait=True)
             self.is_running = False
+            self._jobs_cache = None
+            
+            # 排程任務被取消時，已送出的打卡操作仍在執行，等待其完成
+            if self._inflight_punches:
+                logger.info(f"等待 {len(self._inflight_punches)} 個進行中的打卡操作完成...")
+                await asyncio.gather(*self._inflight_punches, return_exceptions=True)
             logger.info("自動打卡排程器已停止")
     
     async def _add_scheduled_jobs(self, schedule_config: ScheduleConfig):
@@ -106,90 +124,95 @@ class PunchScheduler:
         if not self._punch_callback:
             raise ValueError("打卡回調函數未設定，請先調用 set_punch_callback()")
         
-        # 解析簽到時間
-        clock_in_hour, clock_in_minute = map(int, schedule_config.clock_in_time.split(':'))
-        clock_out_hour, clock_out_minute = map(int, schedule_config.clock_out_time.split(':'))
-        
-        # 設定 cron 觸發器參數
-        cron_kwargs: Dict[str, Any] = {
-            'hour': clock_in_hour,
-            'minute': clock_in_minute,
-            'second': 0
-        }
+        # 設定未變更且任務仍在時，沿用既有任務
+        if (self.scheduler and schedule_config == self._scheduled_config
+                and self.scheduler.get_job('clock_in_job')):
+            logger.debug("排程設定未變更，沿用既有排程任務")
+            return
         
-        if schedule_config.weekdays_only:
-            cron_kwargs['day_of_week'] = '0-4'  # 週一到週五
+        # 簽到與簽退任務：(動作, (時, 分), 任務 ID, 任務名稱)
+        punch_jobs = [
+            (PunchAction.SIGN_IN, schedule_config.clock_in_hm, 'clock_in_job', '自動簽到'),
+            (PunchAction.SIGN_OUT, schedule_config.clock_out_hm, 'clock_out_job', '自動簽退'),
+        ]
         
-        # 添加簽到任務
         if self.scheduler:
-            self.scheduler.add_job(
-            func=self._execute_punch_job,
-            trigger=CronTrigger(**cron_kwargs),
-            args=[PunchAction.SIGN_IN],
-            id='clock_in_job',
-            name='自動簽到',
-            replace_existing=True
-            )
-        
-            # 添加簽退任務
-            cron_kwargs.update({
-                'hour': clock_out_hour,
-                'minute': clock_out_minute
-            })
+            # 先清空既有任務，之後直接加入，不需逐一查找取代
+            self.scheduler.remove_all_jobs()
+            self._punch_job_names.clear()
             
-            self.scheduler.add_job(
-            func=self._execute_punch_job,
-            trigger=CronTrigger(**cron_kwargs),
-            args=[PunchAction.SIGN_OUT],
-            id='clock_out_job',
-            name='自動簽退',
-            replace_existing=True
-            )
+            for action, (hour, minute), job_id, job_name in punch_jobs:
+                trigger = CronTrigger(
+                    hour=hour,
+                    minute=minute,
+                    second=0,
+                    day_of_week=WEEKDAYS if schedule_config.weekdays_only else None,
+                    timezone=TIMEZONE
+                )
+                
+                self.scheduler.add_job(
+                    func=self._execute_punch_job,
+                    trigger=trigger,
+                    args=[action],
+                    id=job_id,
+                    name=job_name,
+                    replace_existing=False
+                )
+                self._punch_job_names[job_id] = job_name
             
             # 添加狀態確認訊息任務
             self.scheduler.add_job(
                 func=self._log_status_message,
-                trigger=IntervalTrigger(seconds=schedule_config.status_message_interval),
+                trigger=IntervalTrigger(seconds=schedule_config.status_message_interval, timezone=TIMEZONE),
                 id='status_message_job',
                 name='定期狀態確認',
-                replace_existing=True
+                replace_existing=False
             )
         
+        self._scheduled_config = schedule_config
+        self._jobs_cache = None
         logger.info(f"已添加排程任務: 簽到 {schedule_config.clock_in_time}, 簽退 {schedule_config.clock_out_time}")
         logger.info(f"已添加狀態確認任務: 每 {schedule_config.status_message_interval} 秒執行一次")
     
     async def _execute_punch_job(self, action: PunchAction):
         """執行打卡任務"""
-        logger.info(f"開始執行排程打卡任務: {action.value}")
+        logger.info("開始執行排程打卡任務: {}", action.value)
         
         try:
             # 執行打卡回調
             if self._punch_callback:
-                result = await self._punch_callback(action)
+                # 以 shield 保護打卡操作，排程器停止時不會在送出途中被取消
+                punch = asyncio.ensure_future(self._punch_callback(action))
+                self._inflight_punches.add(punch)
+                punch.add_done_callback(self._inflight_punches.discard)
+                result = await asyncio.shield(punch)
             else:
                 raise ValueError("打卡回調函數未設定")
             
             if result.success:
-                logger.success(f"排程打卡成功: {action.value} - {result.message}")
+                logger.success("排程打卡成功: {} - {}", action.value, result.message)
             else:
-                logger.error(f"排程打卡失敗: {action.value} - {result.message}")
+                logger.error("排程打卡失敗: {} - {}", action.value, result.message)
                 
-        except Exception as e:
-            logger.error(f"執行排程打卡任務時發生錯誤: {e}")
+        except asyncio.CancelledError:
+            logger.warning("排程打卡任務被取消，{} 打卡操作將繼續完成", action.value)
+            raise
+        except Exception:
+            logger.exception("執行排程打卡任務時發生錯誤: {}", action.value)
     
     async def _log_status_message(self):
         """定期記錄排程器狀態訊息"""
         try:
-            status = self.get_job_status()
-            active_jobs = len(status.get('jobs', []))
+            if not self.scheduler:
+                return
+            active_jobs = len(self.scheduler.get_jobs())
             
-            # 計算下次打卡時間
-            next_runs = self.get_next_runs()
+            # 直接以任務 ID 查詢下次打卡時間
             next_punch_times = []
-            
-            for job_name, next_time in next_runs.items():
-                if job_name in ['自動簽到', '自動簽退'] and next_time:
-                    next_punch_times.append(f"{job_name}: {next_time.strftime('%Y-%m-%d %H:%M:%S')}")
+            for job_id, job_name in self._punch_job_names.items():
+                job = self.scheduler.get_job(job_id)
+                if job and job.next_run_time:
+                    next_punch_times.append(f"{job_name}: {job.next_run_time.strftime('%Y-%m-%d %H:%M:%S')}")
             
             logger.info(f"排程器運行狀態確認 - 活躍任務數: {active_jobs}")
             if next_punch_times:
@@ -200,16 +223,36 @@ class PunchScheduler:
         except Exception as e:
             logger.error(f"記錄狀態訊息時發生錯誤: {e}")
     
+    def _get_jobs_snapshot(self) -> List[Dict[str, Any]]:
+        """取得任務快照，在最近一次任務觸發前（最多 60 秒）重複使用"""
+        now = time.monotonic()
+        if self._jobs_cache and now < self._jobs_cache[0]:
+            return self._jobs_cache[1]
+        
+        jobs_info = []
+        ttl = 60.0
+        wall_now = datetime.now(TIMEZONE)
+        for job in self.scheduler.get_jobs():
+            jobs_info.append({
+                'id': job.id,
+                'name': job.name,
+                'next_run': job.next_run_time,
+                'trigger': str(job.trigger)
+            })
+            if job.next_run_time:
+                ttl = min(ttl, (job.next_run_time - wall_now).total_seconds())
+        
+        # 排程器啟動前任務的下次執行時間尚未確定，不快取
+        if self.is_running:
+            self._jobs_cache = (now + ttl, jobs_info)
+        return jobs_info
+    
     def get_next_runs(self) -> Dict[str, Optional[datetime]]:
         """取得下次執行時間"""
         if not self.scheduler or not self.is_running:
             return {}
         
-        result = {}
-        for job in self.scheduler.get_jobs():
-            result[job.name] = job.next_run_time
-        
-        return result
+        return {job['name']: job['next_run'] for job in self._get_jobs_snapshot()}
     
     def get_job_status(self) -> Dict[str, Any]:
         """取得排程器狀態"""
@@ -219,18 +262,9 @@ class PunchScheduler:
                 'jobs': []
             }
         
-        jobs_info = []
-        for job in self.scheduler.get_jobs():
-            jobs_info.append({
-                'id': job.id,
-                'name': job.name,
-                'next_run': job.next_run_time,
-                'trigger': str(job.trigger)
-            })
-        
         return {
             'running': self.is_running,
-            'jobs': jobs_info,
+            'jobs': [dict(job) for job in self._get_jobs_snapshot()],
             'timezone': str(self.scheduler.timezone)
         }
     
@@ -251,20 +285,10 @@ class PunchScheduler:
 
 
 class SchedulerManager:
-    """排程管理器（單例模式）"""
-    
-    _instance: Optional['SchedulerManager'] = None
-    _scheduler: Optional[PunchScheduler] = None
+    """排程管理器（透過模組層級的 scheduler_manager 共用單一實例）"""
     
-    def __new__(cls):
-        if cls._instance is None:
-            cls._instance = super().__new__(cls)
-        return cls._instance
-    
-    def __init__(self):
-        if self._scheduler is None:
-            from src.config import config_manager
-            self._scheduler = PunchScheduler(config_manager)
+    def __init__(self, config_manager: Optional[ConfigManager] = None):
+        self._scheduler = PunchScheduler(config_manager or default_config_manager)
     
     @property
     def scheduler(self) -> PunchScheduler:
@@ -2,6 +2,8 @@
 Webhook 異常處理
 """
 
+from typing import Optional
+
 
 class WebhookError(Exception):
     """Webhook 基礎異常"""
@@ -20,7 +22,10 @@ class WebhookTimeoutError(WebhookError):
 
 class WebhookRateLimitError(WebhookError):
     """Webhook 速率限制錯誤"""
-    pass
+    
+    def __init__(self, message: str, retry_after: Optional[float] = None):
+        super().__init__(message)
+        self.retry_after = retry_after  # 伺服器要求的等待秒數（Retry-After）
 
 
 class WebhookAuthError(WebhookError):
@@ -6,9 +6,22 @@ import asyncio
 from typing import List, Optional, Dict, Any
 from loguru import logger
 
-from src.models.webhook import WebhookConfig, WebhookMessage, WebhookResponse
+from src.models.webhook import WebhookConfig, WebhookMessage, WebhookResponse, NotificationLevel
 from .providers import WebhookProvider, DiscordWebhookProvider
 
+# 同時進行的發送數上限，與 provider 連線池的單一主機連線數一致
+_MAX_CONCURRENT_SENDS = 5
+
+# 連線測試時每個 provider 的逾時秒數（測試不重試）
+_TEST_TIMEOUT_SECONDS = 3.0
+
+# 沒有 Discord provider 時，排程器事件對應的通知等級
+_SCHEDULER_LEVELS = {
+    "啟動": NotificationLevel.INFO,
+    "停止": NotificationLevel.INFO,
+    "錯誤": NotificationLevel.ERROR
+}
+
 
 class WebhookManager:
     """Webhook 管理器 - 統一管理所有 webhook 提供者"""
@@ -16,11 +29,15 @@ class WebhookManager:
     def __init__(self, config: WebhookConfig):
         self.config = config
         self.providers: List[WebhookProvider] = []
+        # Discord provider，供建立 Discord 格式的通知訊息
+        self._discord_providers: List[DiscordWebhookProvider] = []
+        self._send_semaphore = asyncio.Semaphore(_MAX_CONCURRENT_SENDS)
         self._initialize_providers()
     
     def _initialize_providers(self):
         """初始化 webhook 提供者"""
         self.providers.clear()
+        self._discord_providers.clear()
         
         if not self.config.enabled:
             logger.debug("Webhook 功能已停用")
@@ -32,6 +49,7 @@ class WebhookManager:
                 discord_provider = DiscordWebhookProvider(self.config)
                 if discord_provider.validate_config():
                     self.providers.append(discord_provider)
+                    self._discord_providers.append(discord_provider)
                     logger.info("Discord webhook provider 已初始化")
                 else:
                     logger.warning("Discord webhook 配置無效，跳過初始化")
@@ -58,37 +76,38 @@ class WebhookManager:
         
         logger.info(f"發送 webhook 通知: {message.title} ({message.level.value})")
         
-        # 並行發送到所有 providers
-        tasks = []
+        providers = []
         for provider in self.providers:
             if provider.should_notify(message):
-                task = asyncio.create_task(
-                    provider.send_with_retry(message),
-                    name=f"webhook_{provider.provider_name}"
-                )
-                tasks.append(task)
+                providers.append(provider)
             else:
-                logger.debug(f"根據配置跳過 {provider.provider_name} 通知")
+                logger.debug("根據配置跳過 {} 通知", provider.provider_name)
         
-        if not tasks:
+        if not providers:
             logger.debug("所有 webhook 通知都被配置跳過")
             return []
         
-        # 等待所有任務完成
-        responses = await asyncio.gather(*tasks, return_exceptions=True)
+        webhook_responses: List[WebhookResponse] = []
         
-        # 處理結果
-        webhook_responses = []
-        for i, response in enumerate(responses):
-            if isinstance(response, Exception):
-                logger.error(f"Webhook 發送任務異常: {response}")
-                webhook_responses.append(WebhookResponse(
+        async def send_one(provider: WebhookProvider) -> None:
+            try:
+                async with self._send_semaphore:
+                    response = await provider.send_with_retry(message)
+            except Exception as e:
+                logger.error(f"Webhook 發送任務異常: {e}")
+                response = WebhookResponse(
                     success=False,
-                    provider=f"provider_{i}",
-                    error_message=str(response)
-                ))
-            else:
-                webhook_responses.append(response)
+                    provider=provider.provider_name,
+                    error_message=str(e)
+                )
+            # 每個回應一完成就記錄，不等待較慢的 provider
+            logger.debug("{} webhook 回應: {}", response.provider, "成功" if response.success else "失敗")
+            webhook_responses.append(response)
+        
+        # 並行發送到所有 providers；發送被取消時 TaskGroup 會一併取消尚未完成的重試
+        async with asyncio.TaskGroup() as tg:
+            for provider in providers:
+                tg.create_task(send_one(provider), name=f"webhook_{provider.provider_name}")
         
         # 統計結果
         successful = sum(1 for r in webhook_responses if r.success)
@@ -119,7 +138,7 @@ class WebhookManager:
             List[WebhookResponse]: 發送結果
         """
         # 使用 Discord provider 建立通知訊息（其他 provider 可以有各自的格式）
-        discord_providers = [p for p in self.providers if isinstance(p, DiscordWebhookProvider)]
+        discord_providers = self._discord_providers
         
         if discord_providers:
             message = discord_providers[0].create_punch_notification(
@@ -128,8 +147,6 @@ class WebhookManager:
             return await self.send_notification(message)
         else:
             # 如果沒有 Discord provider，建立通用訊息
-            from src.models.webhook import NotificationLevel
-            
             level = NotificationLevel.SUCCESS if success else NotificationLevel.ERROR
             title = f"{'🎉' if success else '❌'} {action}{'成功' if success else '失敗'}"
             
@@ -157,7 +174,7 @@ class WebhookManager:
             List[WebhookResponse]: 發送結果
         """
         # 使用 Discord provider 建立通知訊息
-        discord_providers = [p for p in self.providers if isinstance(p, DiscordWebhookProvider)]
+        discord_providers = self._discord_providers
         
         if discord_providers:
             message = discord_providers[0].create_scheduler_notification(
@@ -166,18 +183,10 @@ class WebhookManager:
             return await self.send_notification(message)
         else:
             # 如果沒有 Discord provider，建立通用訊息
-            from src.models.webhook import NotificationLevel
-            
-            level_map = {
-                "啟動": NotificationLevel.INFO,
-                "停止": NotificationLevel.INFO,
-                "錯誤": NotificationLevel.ERROR
-            }
-            
             message = WebhookMessage(
                 title=f"📋 排程器{event}",
                 message=message_text,
-                level=level_map.get(event, NotificationLevel.INFO),
+                level=_SCHEDULER_LEVELS.get(event, NotificationLevel.INFO),
                 details=details
             )
             return await self.send_notification(message)
@@ -194,8 +203,22 @@ class WebhookManager:
             level="info"
         )
         
+        async def test_one(provider: WebhookProvider) -> WebhookResponse:
+            # 連線測試不經過重試，各 provider 獨立逾時，避免單一失效的 provider 拖慢結果
+            try:
+                return await asyncio.wait_for(provider.send_message(test_message), timeout=_TEST_TIMEOUT_SECONDS)
+            except asyncio.TimeoutError:
+                error_message = f"連線測試逾時 ({_TEST_TIMEOUT_SECONDS:g}秒)"
+            except Exception as e:
+                error_message = str(e)
+            return WebhookResponse(
+                success=False,
+                provider=provider.provider_name,
+                error_message=error_message
+            )
+        
         logger.info("開始測試 webhook 連線...")
-        responses = await self.send_notification(test_message)
+        responses = list(await asyncio.gather(*(test_one(provider) for provider in self.providers)))
         
         for response in responses:
             if response.success:
@@ -205,13 +228,18 @@ class WebhookManager:
         
         return responses
     
-    def reload_config(self, new_config: WebhookConfig):
-        """重新載入配置
+    async def close(self):
+        """關閉所有 provider 的連線資源"""
+        await asyncio.gather(*(provider.close() for provider in self.providers), return_exceptions=True)
+    
+    async def reload_config(self, new_config: WebhookConfig):
+        """重新載入配置（先關閉舊 provider 的連線資源再重建）
         
         Args:
             new_config: 新的 webhook 配置
         """
         logger.info("重新載入 webhook 配置...")
+        await self.close()
         self.config = new_config
         self._initialize_providers()
         logger.info(f"Webhook 配置已更新，當前有 {len(self.providers)} 個可用的提供者")
@@ -3,11 +3,14 @@ Webhook Provider 抽象基類
 """
 
 import asyncio
+import random
+import stat
 from abc import ABC, abstractmethod
+from pathlib import Path
 from typing import Optional, List
 from loguru import logger
 
-from src.models.webhook import WebhookMessage, WebhookResponse, WebhookConfig
+from src.models.webhook import WebhookMessage, WebhookResponse, WebhookConfig, NotificationLevel
 from ..exceptions import WebhookTimeoutError, WebhookRateLimitError
 
 
@@ -16,7 +19,14 @@ class WebhookProvider(ABC):
     
     def __init__(self, config: WebhookConfig):
         self.config = config
-        self.last_request_time = 0.0
+        self.last_request_time = float('-inf')  # 上次請求的事件迴圈時間
+        # 各通知等級是否發送，依配置預先建立
+        self._level_map = {
+            NotificationLevel.SUCCESS: config.notify_success,
+            NotificationLevel.ERROR: config.notify_failure,
+            NotificationLevel.WARNING: config.notify_errors,
+            NotificationLevel.INFO: config.notify_scheduler,
+        }
     
     @abstractmethod
     async def send_message(self, message: WebhookMessage) -> WebhookResponse:
@@ -45,6 +55,10 @@ class WebhookProvider(ABC):
         """Provider 名稱"""
         pass
     
+    async def close(self) -> None:
+        """釋放 provider 持有的資源（例如 HTTP 連線）"""
+        pass
+    
     async def send_with_retry(self, message: WebhookMessage) -> WebhookResponse:
         """帶重試機制的發送訊息
         
@@ -57,6 +71,7 @@ class WebhookProvider(ABC):
         last_exception = None
         
         for attempt in range(1, self.config.retry_attempts + 1):
+            retry_delay: Optional[float] = None
             try:
                 # 速率限制
                 await self._rate_limit()
@@ -78,8 +93,11 @@ class WebhookProvider(ABC):
             except WebhookRateLimitError as e:
                 last_exception = e
                 logger.warning(f"Webhook 速率限制 ({self.provider_name}, 第{attempt}次嘗試): {e}")
-                # 速率限制錯誤等待更長時間
-                await asyncio.sleep(min(5.0 * attempt, 30.0))
+                # 依伺服器的 Retry-After 等待；未提供時等待較長時間（皆加入隨機抖動，避免多個發送同時重試）
+                if e.retry_after is not None:
+                    retry_delay = max(e.retry_after, 0.5) * random.uniform(1.0, 1.2)
+                else:
+                    retry_delay = random.uniform(1.0, 1.3) * min(5.0 * attempt, 30.0)
                 
             except Exception as e:
                 last_exception = e
@@ -87,9 +105,11 @@ class WebhookProvider(ABC):
             
             # 等待後重試
             if attempt < self.config.retry_attempts:
-                wait_time = min(2.0 ** attempt, 10.0)  # 指數退避，最大10秒
-                logger.debug(f"等待 {wait_time} 秒後重試...")
-                await asyncio.sleep(wait_time)
+                if retry_delay is None:
+                    # 指數退避（最大10秒）並加入隨機抖動
+                    retry_delay = random.uniform(0.5, 1.5) * min(2.0 ** attempt, 10.0)
+                logger.debug("等待 {:.2f} 秒後重試...", retry_delay)
+                await asyncio.sleep(retry_delay)
         
         # 所有重試都失敗
         error_msg = f"Webhook 發送失敗，已重試 {self.config.retry_attempts} 次"
@@ -104,18 +124,16 @@ class WebhookProvider(ABC):
         )
     
     async def _rate_limit(self):
-        """速率限制控制"""
-        import time
-        
-        current_time = time.time()
-        time_since_last = current_time - self.last_request_time
+        """速率限制控制（使用事件迴圈的單調時鐘，不受系統時間調整影響）"""
+        loop = asyncio.get_running_loop()
+        time_since_last = loop.time() - self.last_request_time
         
         if time_since_last < self.config.rate_limit_delay:
             wait_time = self.config.rate_limit_delay - time_since_last
-            logger.debug(f"速率限制等待 {wait_time:.2f} 秒")
+            logger.debug("速率限制等待 {:.2f} 秒", wait_time)
             await asyncio.sleep(wait_time)
         
-        self.last_request_time = time.time()
+        self.last_request_time = loop.time()
     
     def should_notify(self, message: WebhookMessage) -> bool:
         """檢查是否應該發送通知
@@ -126,26 +144,19 @@ class WebhookProvider(ABC):
         Returns:
             bool: 是否應該發送
         """
-        from src.models.webhook import NotificationLevel
-        
         if not self.config.enabled:
             return False
         
         # 根據通知等級和配置決定是否發送
-        level_config_map = {
-            NotificationLevel.SUCCESS: self.config.notify_success,
-            NotificationLevel.ERROR: self.config.notify_failure,
-            NotificationLevel.WARNING: self.config.notify_errors,
-            NotificationLevel.INFO: self.config.notify_scheduler,
-        }
-        
-        return level_config_map.get(message.level, True)
+        return self._level_map.get(message.level, True)
     
-    def _format_attachments(self, attachments: Optional[List[str]]) -> List[str]:
-        """格式化附件列表
+    def _format_attachments(self, attachments: Optional[List[str]],
+                            max_size: Optional[int] = None) -> List[str]:
+        """格式化附件列表（每個檔案只做一次 stat）
         
         Args:
             attachments: 原始附件路徑列表
+            max_size: 單一檔案大小上限（位元組），None 表示不限制
             
         Returns:
             List[str]: 有效的附件路徑列表
@@ -156,12 +167,19 @@ class WebhookProvider(ABC):
         valid_attachments = []
         for path in attachments:
             try:
-                from pathlib import Path
                 file_path = Path(path)
-                if file_path.exists() and file_path.is_file():
-                    valid_attachments.append(str(file_path.absolute()))
-                else:
+                try:
+                    file_stat = file_path.stat()
+                except FileNotFoundError:
                     logger.warning(f"附件檔案不存在: {path}")
+                    continue
+                
+                if not stat.S_ISREG(file_stat.st_mode):
+                    logger.warning(f"附件檔案不存在: {path}")
+                elif max_size is not None and file_stat.st_size > max_size:
+                    logger.warning(f"檔案過大，跳過上傳: {path}")
+                else:
+                    valid_attachments.append(str(file_path.absolute()))
             except Exception as e:
                 logger.error(f"處理附件時發生錯誤 {path}: {e}")
         
@@ -5,18 +5,56 @@ Discord Webhook Provider 實作
 import asyncio
 import aiohttp
 import json
+import mimetypes
 from datetime import datetime
 from pathlib import Path
 from typing import Optional, Dict, Any, List
 from loguru import logger
 
 from src.models.webhook import (
-    WebhookMessage, WebhookResponse, WebhookConfig, 
-    DiscordEmbed, DiscordWebhookPayload, NotificationLevel
+    WebhookMessage, WebhookResponse, WebhookConfig, NotificationLevel
 )
 from .base import WebhookProvider
 from ..exceptions import WebhookTimeoutError, WebhookRateLimitError, WebhookAuthError
 
+try:
+    import orjson
+except ImportError:  # orjson 為選用套件，未安裝時改用標準庫 json
+    orjson = None
+
+# Discord 附件大小上限（8MB）
+_MAX_FILE_SIZE = 8 * 1024 * 1024
+
+# payload 中不隨訊息變動的部分
+_USERNAME = "震旦HR打卡機器人"
+_FOOTERS = {
+    level: {"text": f"震旦HR打卡系統 • {level.value.upper()}"} for level in NotificationLevel
+}
+
+# 排程器事件對應的標題與通知等級
+_SCHEDULER_TITLES = {
+    "啟動": "🕐 排程器啟動",
+    "停止": "💤 排程器停止",
+    "錯誤": "🚨 排程器錯誤"
+}
+_SCHEDULER_LEVELS = {
+    "啟動": NotificationLevel.INFO,
+    "停止": NotificationLevel.INFO,
+    "錯誤": NotificationLevel.ERROR
+}
+
+
+def _now_text() -> str:
+    """目前時間字串（YYYY-MM-DD HH:MM:SS）"""
+    return datetime.now().isoformat(sep=' ', timespec='seconds')
+
+
+def _dump_json(payload: Dict[str, Any]) -> bytes:
+    """將 payload 序列化為 UTF-8 JSON"""
+    if orjson is not None:
+        return orjson.dumps(payload)
+    return json.dumps(payload, ensure_ascii=False).encode('utf-8')
+
 
 class DiscordWebhookProvider(WebhookProvider):
     """Discord Webhook Provider"""
@@ -24,6 +62,8 @@ class DiscordWebhookProvider(WebhookProvider):
     def __init__(self, config: WebhookConfig):
         super().__init__(config)
         self.webhook_url = str(config.discord_url) if config.discord_url else None
+        # 共用的 HTTP session，重複使用連線池與 keep-alive 連線
+        self._session: Optional[aiohttp.ClientSession] = None
     
     @property
     def provider_name(self) -> str:
@@ -42,7 +82,7 @@ class DiscordWebhookProvider(WebhookProvider):
         return True
     
     async def send_message(self, message: WebhookMessage) -> WebhookResponse:
-        """發送訊息到 Discord Webhook"""
+        """發送訊息到 Discord Webhook（是否通知由 WebhookManager 依 should_notify 先行篩選）"""
         if not self.validate_config():
             return WebhookResponse(
                 success=False,
@@ -50,55 +90,48 @@ class DiscordWebhookProvider(WebhookProvider):
                 error_message="Discord 配置無效"
             )
         
-        if not self.should_notify(message):
-            logger.debug(f"根據配置跳過 Discord 通知: {message.level}")
-            return WebhookResponse(
-                success=True,
-                provider=self.provider_name,
-                status_code=200,
-                response_text="通知已跳過（根據配置）"
-            )
-        
         try:
             # 建立 Discord payload
             payload = self._create_discord_payload(message)
             
             # 準備附件
+            # 檔案檢查於背景執行緒進行，不阻塞事件迴圈
             files = None
             if message.attachments:
-                valid_attachments = self._format_attachments(message.attachments)
-                if valid_attachments:
-                    files = await self._prepare_files(valid_attachments)
+                files = await asyncio.to_thread(self._format_attachments, message.attachments, _MAX_FILE_SIZE)
+            
+            # 先完整建立請求內容，再取用連線，縮短連線占用時間
+            if files:
+                # 有附件時使用 multipart/form-data
+                body = aiohttp.FormData()
+                body.add_field('payload_json', _dump_json(payload).decode('utf-8'))
+                
+                # 先於背景執行緒讀入檔案內容，以 bytes 上傳，不需另外管理檔案控制代碼
+                contents = await asyncio.gather(
+                    *(asyncio.to_thread(Path(file_path).read_bytes) for file_path in files)
+                )
+                for i, (file_path, content) in enumerate(zip(files, contents)):
+                    body.add_field(
+                        f'file{i}', content,
+                        filename=Path(file_path).name,
+                        content_type=mimetypes.guess_type(file_path)[0] or 'application/octet-stream'
+                    )
+                headers = None
+            else:
+                # 純文字訊息
+                body = _dump_json(payload)
+                headers = {'Content-Type': 'application/json'}
             
             # 發送請求
-            async with aiohttp.ClientSession(timeout=aiohttp.ClientTimeout(total=self.config.timeout_seconds)) as session:
-                if files:
-                    # 有附件時使用 multipart/form-data
-                    data = aiohttp.FormData()
-                    data.add_field('payload_json', json.dumps(payload.model_dump(exclude_none=True)))
+            session = await self._get_session()
+            async with session.post(self.webhook_url, data=body, headers=headers) as response:
+                return await self._handle_response(response)
                     
-                    for i, file_path in enumerate(files):
-                        file_obj = open(file_path, 'rb')
-                        data.add_field(f'file{i}', file_obj, filename=Path(file_path).name)
-                    
-                    async with session.post(self.webhook_url, data=data) as response:
-                        # 關閉檔案
-                        for field in data._fields:
-                            if hasattr(field[2], 'close'):
-                                field[2].close()
-                        
-                        return await self._handle_response(response)
-                else:
-                    # 純文字訊息
-                    async with session.post(
-                        self.webhook_url,
-                        json=payload.model_dump(exclude_none=True),
-                        headers={'Content-Type': 'application/json'}
-                    ) as response:
-                        return await self._handle_response(response)
-                        
         except asyncio.TimeoutError:
             raise WebhookTimeoutError(f"Discord webhook 請求超時 ({self.config.timeout_seconds}秒)")
+        except WebhookRateLimitError:
+            # 交由 send_with_retry 依 Retry-After 等待
+            raise
         except Exception as e:
             logger.error(f"Discord webhook 發送失敗: {e}")
             return WebhookResponse(
@@ -107,53 +140,44 @@ class DiscordWebhookProvider(WebhookProvider):
                 error_message=str(e)
             )
     
-    def _create_discord_payload(self, message: WebhookMessage) -> DiscordWebhookPayload:
-        """建立 Discord webhook payload"""
+    async def _get_session(self) -> aiohttp.ClientSession:
+        """取得共用的 HTTP session，首次使用或已關閉時建立"""
+        if self._session is None or self._session.closed:
+            self._session = aiohttp.ClientSession(
+                connector=aiohttp.TCPConnector(limit=10, limit_per_host=5, keepalive_timeout=60),
+                timeout=aiohttp.ClientTimeout(total=self.config.timeout_seconds)
+            )
+        return self._session
+    
+    async def close(self) -> None:
+        """關閉共用的 HTTP session"""
+        if self._session is not None and not self._session.closed:
+            await self._session.close()
+        self._session = None
+    
+    def _create_discord_payload(self, message: WebhookMessage) -> Dict[str, Any]:
+        """建立 Discord webhook payload（已可直接序列化的 dict）"""
         # 建立 embed
-        embed = DiscordEmbed(
-            title=message.title,
-            description=message.message,
-            color=message.color_code,
-            timestamp=message.timestamp.isoformat()
-        )
+        embed: Dict[str, Any] = {
+            "title": message.title,
+            "description": message.message,
+            "color": message.color_code,
+            "timestamp": message.timestamp.isoformat()
+        }
         
         # 添加欄位
         if message.details:
-            embed.fields = []
-            for key, value in message.details.items():
-                if value is not None:
-                    embed.fields.append({
-                        "name": str(key),
-                        "value": str(value),
-                        "inline": True
-                    })
+            embed["fields"] = [
+                {"name": str(key), "value": str(value), "inline": True}
+                for key, value in message.details.items()
+                if value is not None
+            ]
         
-        # 添加頁尾
-        embed.footer = {
-            "text": f"震旦HR打卡系統 • {message.level.value.upper()}"
-        }
+        # 添加頁尾（各等級的頁尾固定，預先建立）
+        embed["footer"] = _FOOTERS[message.level]
         
         # 建立 payload
-        return DiscordWebhookPayload(
-            embeds=[embed],
-            username="震旦HR打卡機器人"
-        )
-    
-    async def _prepare_files(self, file_paths: List[str]) -> List[str]:
-        """準備要上傳的檔案"""
-        valid_files = []
-        
-        for file_path in file_paths:
-            try:
-                path = Path(file_path)
-                if path.exists() and path.stat().st_size <= 8 * 1024 * 1024:  # Discord 8MB 限制
-                    valid_files.append(str(path))
-                else:
-                    logger.warning(f"檔案過大或不存在，跳過上傳: {file_path}")
-            except Exception as e:
-                logger.error(f"處理檔案時發生錯誤 {file_path}: {e}")
-        
-        return valid_files
+        return {"embeds": [embed], "username": _USERNAME}
     
     async def _handle_response(self, response: aiohttp.ClientResponse) -> WebhookResponse:
         """處理 Discord API 回應"""
@@ -168,9 +192,12 @@ class DiscordWebhookProvider(WebhookProvider):
                 response_text=response_text
             )
         elif response.status == 429:
-            # 速率限制
-            retry_after = response.headers.get('Retry-After', '1')
-            raise WebhookRateLimitError(f"Discord API 速率限制，請等待 {retry_after} 秒")
+            # 速率限制，將伺服器要求的等待時間交給重試流程
+            try:
+                retry_after: Optional[float] = float(response.headers.get('Retry-After', '1'))
+            except ValueError:
+                retry_after = None
+            raise WebhookRateLimitError(f"Discord API 速率限制，請等待 {retry_after} 秒", retry_after)
         elif response.status == 401 or response.status == 403:
             raise WebhookAuthError(f"Discord webhook 認證失敗: {response_text}")
         else:
@@ -210,7 +237,7 @@ class DiscordWebhookProvider(WebhookProvider):
         # 準備詳細資訊
         notification_details = {
             "動作": action,
-            "時間": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+            "時間": _now_text(),
         }
         
         if details:
@@ -238,21 +265,9 @@ class DiscordWebhookProvider(WebhookProvider):
         Returns:
             WebhookMessage: 格式化的通知訊息
         """
-        title_map = {
-            "啟動": "🕐 排程器啟動",
-            "停止": "💤 排程器停止", 
-            "錯誤": "🚨 排程器錯誤"
-        }
-        
-        level_map = {
-            "啟動": NotificationLevel.INFO,
-            "停止": NotificationLevel.INFO,
-            "錯誤": NotificationLevel.ERROR
-        }
-        
         return WebhookMessage(
-            title=title_map.get(event, f"📋 排程器{event}"),
+            title=_SCHEDULER_TITLES.get(event, f"📋 排程器{event}"),
             message=message,
-            level=level_map.get(event, NotificationLevel.INFO),
-            details=details or {"事件": event, "時間": datetime.now().strftime("%Y-%m-%d %H:%M:%S")}
+            level=_SCHEDULER_LEVELS.get(event, NotificationLevel.INFO),
+            details=details or {"事件": event, "時間": _now_text()}
         )
\ No newline at end of file